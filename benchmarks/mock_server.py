@@ -0,0 +1,219 @@
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+ENTITIES = ('MajorUnit', 'Category', 'Product')
+DUPLICATE_MESSAGE = "The default par code has already been taken."
+
+
+class MockFatoorahServer:
+    # Local stand-in for the MajorUnit, Category and Product /all and /create
+    # endpoints, returning the response shapes shown in API_Documentation.
+    # Latency, error rate, 429 throttling and duplicate-barcode rejections are
+    # configurable so upload throughput can be measured repeatably.
+    # lost_response_rate commits a create and then drops the connection
+    # without answering, like a timeout after the server has saved the row.
+    # Every Authorization header is its own account with its own listing.
+    # Barcodes are unique per account (barcode_scope='account') or per
+    # stock_id of an account ('stock'); the real API's rule is not
+    # documented, so both can be exercised.
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit=None, seed=None, lost_response_rate=0.0, barcode_scope='account'):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lost_response_rate = lost_response_rate
+        self.rate_limit = rate_limit
+        self.barcode_scope = barcode_scope
+        self.random = random.Random(seed)
+
+        self.items = {entity: [] for entity in ENTITIES}
+        self.accounts = {}
+        self.barcodes = set()
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'duplicates': 0, 'lost': 0}
+        self._next_id = 1000
+        self._lock = threading.Lock()
+        self._tokens = float(rate_limit or 0)
+        self._refilled = time.monotonic()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/apiAdmin"
+
+    def endpoints(self):
+        return {
+            'product': f"{self.base_url}/Product",
+            'category': f"{self.base_url}/Category",
+            'major_unit': f"{self.base_url}/MajorUnit",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _throttled(self):
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return False
+            self.stats['throttled'] += 1
+            return True
+
+    def _list(self, entity, query, account=None):
+        keyword = query.get('keyword', [''])[0]
+        page = max(1, int(query.get('page', ['1'])[0]))
+        per_page = max(1, int(query.get('per_page', query.get('limit', ['20']))[0]))
+        with self._lock:
+            items = [i for i in self.items[entity] if keyword in i['name'] and self.accounts[i['id']] == account]
+        chunk = items[(page - 1) * per_page: page * per_page]
+        return {"status": 1, "message": "", "data": {"data": chunk, "pagination": {
+            "total": len(items),
+            "count": len(chunk),
+            "per_page": str(per_page),
+            "current_page": page,
+            "total_pages": max(1, -(-len(items) // per_page)),
+        }}}
+
+    def _create(self, entity, data, account=None):
+        if not str(data.get('name', '')).strip():
+            return {"status": 0, "message": "The name field is required."}
+        barcode = str(data.get('defaultParCode', '')).strip()
+        with self._lock:
+            if entity == 'Product' and barcode:
+                stock = data.get('stock_id') if self.barcode_scope == 'stock' else None
+                if (account, stock, barcode) in self.barcodes:
+                    self.stats['duplicates'] += 1
+                    return {"status": 0, "message": DUPLICATE_MESSAGE}
+                self.barcodes.add((account, stock, barcode))
+            self._next_id += 1
+            item = dict(data, id=self._next_id)
+            self.items[entity].append(item)
+            self.accounts[item['id']] = account
+        return {"status": 1, "message": "", "data": item}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this
+                # Nagle plus delayed ACKs add ~40ms to every response.
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def _dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with server._lock:
+                    server.stats['requests'] += 1
+
+                delay = server.random.gauss(server.latency, server.jitter) if server.jitter else server.latency
+                if delay > 0:
+                    time.sleep(delay)
+
+                if server._throttled():
+                    return self._reply({"message": "Too Many Attempts."}, 429, {'Retry-After': '1'})
+                if server.error_rate and server.random.random() < server.error_rate:
+                    with server._lock:
+                        server.stats['errors'] += 1
+                    return self._reply({"message": "Server Error"}, 503)
+
+                url = urlparse(self.path)
+                parts = url.path.strip('/').split('/')
+                if len(parts) < 2 or parts[-2] not in ENTITIES or (method, parts[-1]) not in (('GET', 'all'), ('POST', 'create')):
+                    return self._reply({"message": "Not Found"}, 404)
+                entity, action = parts[-2], parts[-1]
+
+                account = self.headers.get('Authorization')
+                if action == 'all':
+                    return self._reply(server._list(entity, parse_qs(url.query), account))
+
+                if 'json' in self.headers.get('Content-Type', ''):
+                    data = json.loads(body or b'{}')
+                else:
+                    data = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+                result = server._create(entity, data, account)
+                if server.lost_response_rate and server.random.random() < server.lost_response_rate:
+                    with server._lock:
+                        server.stats['lost'] += 1
+                    self.close_connection = True
+                    return
+                return self._reply(result)
+
+            def _reply(self, payload, status=200, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Fatoorah API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help="mean response latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="latency standard deviation in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--rate-limit', type=float, default=None, help="requests/sec before answering 429")
+    parser.add_argument('--lost-response-rate', type=float, default=0.0,
+                        help="fraction of creates that are saved but never answered")
+    parser.add_argument('--barcode-scope', choices=('account', 'stock'), default='account',
+                        help="whether a barcode is unique per account or per stock")
+    args = parser.parse_args()
+
+    server = MockFatoorahServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, rate_limit=args.rate_limit,
+                                lost_response_rate=args.lost_response_rate, barcode_scope=args.barcode_scope)
+    print(f"Mock Fatoorah API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main as pipeline
+from benchmarks.mock_server import MockFatoorahServer
+
+
+UNITS = ['حبه', 'درزن', 'علبة', 'كرتون', 'شدة', 'باكت', 'طقم', 'مجموعة', 'استاند', 'رزمة', 'كيس', 'لفة']
+CATEGORIES = [f'فئة {i}' for i in range(20)]
+
+
+def generate_catalog(rows, path, seed=0, duplicate_rate=0.01):
+    # Name groups of one Type 1 product followed by up to two Type 5 packs.
+    rng = random.Random(seed)
+    records = []
+    group = 0
+    while len(records) < rows:
+        name = f"منتج تجريبي {group}"
+        category = rng.choice(CATEGORIES)
+        price = round(rng.uniform(1, 200), 2)
+        records.append({
+            'name': name, 'product_type': 1, 'buy_price': round(price * 0.6, 2), 'sale_price': price,
+            'bar_code': str(6200000000000 + len(records)), 'category': category, 'unit': 'حبه',
+            'Conversion_rate': 1, 'first_quantity': rng.randint(0, 50),
+        })
+        for _ in range(rng.randint(0, 2)):
+            if len(records) >= rows:
+                break
+            rate = rng.choice([6, 12, 24, 50])
+            records.append({
+                'name': name, 'product_type': 5, 'buy_price': round(price * rate * 0.6, 2),
+                'sale_price': round(price * rate * 0.9, 2), 'bar_code': str(6200000000000 + len(records)),
+                'category': category, 'unit': rng.choice(UNITS[1:]), 'Conversion_rate': rate,
+                'first_quantity': 0,
+            })
+        group += 1
+
+    for record in rng.sample(records, int(len(records) * duplicate_rate)):
+        record['bar_code'] = records[rng.randrange(len(records))]['bar_code']
+
+    df = pd.DataFrame(records)
+    df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    if str(path).endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+    return len(df)
+
+
+class RssSampler:
+    # Samples the process resident set size in a background thread. Much
+    # cheaper than tracemalloc, which slows every allocation in every thread
+    # (including the in-process mock server) and distorts throughput.
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def reset_peak(self):
+        self.peak = self.current()
+
+    def current(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def run_case(rows, args):
+    work_dir = Path(tempfile.mkdtemp(prefix=f"bench_{rows}_"))
+    input_file = work_dir / f"catalog.{args.format}"
+    generate_catalog(rows, input_file, seed=args.seed)
+
+    stages = []
+    requests = {}
+
+    sampler = RssSampler() if args.memory == 'rss' else None
+
+    def peak_mb():
+        if args.memory == 'tracemalloc':
+            return tracemalloc.get_traced_memory()[1] / 1e6
+        if sampler:
+            return max(sampler.peak, sampler.current()) / 1e6
+        return None
+
+    @contextlib.contextmanager
+    def stage_hook(name):
+        if args.memory == 'tracemalloc':
+            tracemalloc.reset_peak()
+        elif sampler:
+            sampler.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages.append({
+                'stage': name,
+                'seconds': time.perf_counter() - started,
+                'peak_mb': peak_mb(),
+            })
+
+    def http_hook(method, url, response, elapsed, attempts):
+        key = f"{method} {'/'.join(url.rstrip('/').split('/')[-2:])}"
+        requests.setdefault(key, []).append(elapsed)
+
+    server = MockFatoorahServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                rate_limit=args.rate_limit, seed=args.seed,
+                                lost_response_rate=args.lost_response_rate).start()
+    config = {
+        'token': 'benchmark',
+        'tax_id': '1',
+        'stock_id': '1',
+        'base_path': work_dir,
+        'input_file': str(input_file),
+        'sorted_file': str(work_dir / '_sorted_products.xlsx'),
+        'units_mapping': str(work_dir / 'units_mapping.json'),
+        'categories_mapping': str(work_dir / 'categories_mapping.json'),
+        'upload_cache': str(work_dir / 'upload_cache.json'),
+        'stream_upload_cache': str(work_dir / 'upload_cache_stream.json'),
+        'duplicate_report': str(work_dir / 'duplicate_barcodes_report.xlsx'),
+        'upload_workers': args.workers,
+        'requests_per_second': args.rps,
+        'streaming': args.streaming,
+        'api_endpoints': server.endpoints(),
+        # Stages run one at a time so each peak belongs to one stage.
+        'parallel_stages': False,
+        'stage_hook': stage_hook,
+        'http_hooks': [http_hook],
+    }
+
+    if args.memory == 'tracemalloc':
+        tracemalloc.start()
+    elif sampler:
+        sampler.start()
+    started = time.perf_counter()
+    try:
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log if not args.verbose else sys.stdout):
+            pipeline.run_pipeline(config)
+    finally:
+        total = time.perf_counter() - started
+        if args.memory == 'tracemalloc':
+            tracemalloc.stop()
+        elif sampler:
+            sampler.stop()
+        server.stop()
+
+    return {
+        'rows': rows,
+        'total_seconds': total,
+        'rows_per_sec': rows / total if total else 0.0,
+        'stages': [dict(s, rows_per_sec=rows / s['seconds'] if s['seconds'] else 0.0) for s in stages],
+        'requests': {
+            key: {
+                'count': len(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+            } for key, values in sorted(requests.items())
+        },
+        'server': dict(server.stats),
+        'work_dir': str(work_dir),
+    }
+
+
+def print_report(result):
+    print(f"\n{'=' * 72}")
+    print(f" {result['rows']} rows: {result['total_seconds']:.2f}s total, {result['rows_per_sec']:.1f} rows/sec")
+    print(f"{'-' * 72}")
+    print(f" {'stage':<26}{'seconds':>10}{'rows/sec':>14}{'peak MB':>12}")
+    for s in result['stages']:
+        peak = f"{s['peak_mb']:.1f}" if s['peak_mb'] is not None else '-'
+        print(f" {s['stage']:<26}{s['seconds']:>10.2f}{s['rows_per_sec']:>14.1f}{peak:>12}")
+    print(f"{'-' * 72}")
+    print(f" {'request':<26}{'count':>10}{'p50 ms':>14}{'p99 ms':>12}")
+    for key, r in result['requests'].items():
+        print(f" {key:<26}{r['count']:>10}{r['p50_ms']:>14.1f}{r['p99_ms']:>12.1f}")
+    print(f" server: {result['server']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark against the mock Fatoorah API")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="comma separated catalog sizes")
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help="synthetic catalog file format")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rps', type=float, default=500, help="client requests_per_second budget")
+    parser.add_argument('--latency', type=float, default=0.02, help="mock server latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None, help="mock server 429 threshold (req/s)")
+    parser.add_argument('--lost-response-rate', type=float, default=0.0,
+                        help="fraction of creates the mock saves but never answers")
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--memory', choices=['rss', 'tracemalloc', 'off'], default='rss',
+                        help="peak memory source: sampled process RSS, Python heap (slow) or none")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--verbose', action='store_true', help="show pipeline output")
+    args = parser.parse_args()
+
+    results = []
+    for rows in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        result = run_case(rows, args)
+        print_report(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
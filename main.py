@@ -1,32 +1,50 @@
+import argparse
+import contextlib
 import os
 import sys
+import threading
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from modules import (
+    api_client,
+    batch_runner,
+    build_payloads,
+    data_loader,
+    rate_limiter,
+    reconcile_products,
     sort_products,
     sync_units,
     sync_categories,
     check_duplicate_barcodes,
-    send_products
+    distributed_upload,
+    id_cache,
+    payload_artifact,
+    send_products,
+    stage_graph,
+    telemetry,
+    upload_journal,
+    validate_products
 )
 
 
-def get_user_input():
+def get_user_input(ask_file=True):
 
     token = input("\n Enter API Token: ").strip()
     if not token:
         print(" Token is required")
         sys.exit(1)
-    stock_id = input("\n Enter stock_id: ").strip()
-    if not token:
-        print(" stock_id is required")
-        sys.exit(1)
-    tax_id = input("\n Enter tax_id: ").strip()
-    if not token:
-        print(" tax_id is required")
-        sys.exit(1)
+    stock_id = tax_id = ''
+    if ask_file:
+        stock_id = input("\n Enter stock_id: ").strip()
+        if not token:
+            print(" stock_id is required")
+            sys.exit(1)
+        tax_id = input("\n Enter tax_id: ").strip()
+        if not token:
+            print(" tax_id is required")
+            sys.exit(1)
     
     default_path = str(Path(__file__).parent)
     path_input = input(f"\n Enter base path (default: {default_path}): ").strip()
@@ -36,6 +54,9 @@ def get_user_input():
         print(f" Path does not exist: {base_path}")
         sys.exit(1)
     
+    if not ask_file:
+        return build_config(token, tax_id, stock_id, base_path, '')
+
     print(f"\n Excel files in {base_path}:")
     excel_files = list(base_path.glob("*.xlsx"))
     for i, f in enumerate(excel_files, 1):
@@ -56,19 +77,54 @@ def get_user_input():
             print(f" File not found: {input_file}")
             sys.exit(1)
     
-    return {
+    return build_config(token, tax_id, stock_id, base_path, input_file)
+
+
+def build_config(token, tax_id, stock_id, base_path, input_file, **overrides):
+    base_path = Path(base_path)
+    config = {
         'token': token,
         'tax_id': tax_id,
         'stock_id': stock_id,
-        'token': token,
         'base_path': base_path,
         'input_file': str(input_file),
         'sorted_file': str(base_path / '_sorted_products.xlsx'),
+        'save_sorted': False,
+        'streaming': False,
+        'stream_batch_size': 1000,
+        'reconcile': True,
+        'payloads_file': None,
         'units_mapping': str(base_path / 'units_mapping.json'),
+        # Shared across runs and clients; FATOORAH_ID_CACHE points several
+        # base paths at one file.
+        'id_cache': os.environ.get('FATOORAH_ID_CACHE') or str(base_path / 'id_cache.db'),
+        'id_cache_ttl': 7 * 24 * 3600,
         'categories_mapping': str(base_path / 'categories_mapping.json'),
+        # One key-based checkpoint for every upload mode; the streaming file
+        # is only read for row-index entries of older streaming runs.
         'upload_cache': str(base_path / 'upload_cache.json'),
+        'stream_upload_cache': str(base_path / 'upload_cache_stream.json'),
         'duplicate_report': str(base_path / 'duplicate_barcodes_report.xlsx'),
+        'dead_letter_file': str(base_path / 'failed_products.jsonl'),
+        'validate': True,
+        # Rows edited since their last upload are only reported unless
+        # resend_changed is set; the API then creates a second product.
+        'resend_changed': False,
+        'skip_duplicates': True,
+        # Fan-out to several stocks of one account: 'upload' or 'skip'.
+        'same_account_stocks': 'upload',
+        'validation_report': str(base_path / 'validation_report.xlsx'),
+        'upload_workers': 8,
+        'http_timeout': 30,
+        'max_retries': 5,
+        'requests_per_second': 10,
+        'upload_processes': 1,
+        'shard_store': str(base_path / 'upload_shards.db'),
+        'shard_size': 500,
+        'lease_seconds': 60,
     }
+    config.update(overrides)
+    return config
 
 
 def build_headers(token, include_content_type=True):
@@ -85,6 +141,17 @@ def build_headers(token, include_content_type=True):
     return headers
 
 
+def build_client(config):
+    return api_client.ApiClient(
+        build_headers(config['token'], include_content_type=False),
+        timeout=config.get('http_timeout', 30),
+        max_retries=config.get('max_retries', 5),
+        pool_size=max(config.get('upload_workers', 1), 10),
+        rate_limiter=rate_limiter.RateLimiter(rate=config.get('requests_per_second', 10)),
+        hooks=config.get('http_hooks')
+    )
+
+
 API_ENDPOINTS = {
     'product': 'https://dev-api.fatoorah.sa/apiAdmin/Product',
     'category': 'https://dev-api.fatoorah.sa/apiAdmin/Category',
@@ -93,67 +160,503 @@ API_ENDPOINTS = {
 
 
 def run_pipeline(config):
-  
-    
-    # Step 1: Sort Products
-    print("\n Step 1: Sorting Products...")
-    print("-" * 40)
-    sort_products.run(
-        input_file=config['input_file'],
-        output_file=config['sorted_file']
-    )
-    
-    # Step 2: Sync Units
-    print("\n Step 2: Syncing Units...")
-    print("-" * 40)
-    sync_units.run(
-        input_file=config['sorted_file'],
-        output_mapping=config['units_mapping'],
-        token=config['token'],
-        api_base=API_ENDPOINTS['major_unit'],
-        headers=build_headers(config['token'])
-    )
-    
-    # Step 3: Sync Categories
-    print("\n  Step 3: Syncing Categories...")
-    print("-" * 40)
-    sync_categories.run(
-        input_file=config['sorted_file'],
-        output_mapping=config['categories_mapping'],
-        token=config['token'],
-        api_base=API_ENDPOINTS['category'],
-        headers=build_headers(config['token'])
-    )
-    
-    # Step 4: Check Duplicates
-    print("\n Step 4: Checking Duplicate Barcodes...")
-    print("-" * 40)
-    check_duplicate_barcodes.run(
-        input_file=config['input_file'],
-        output_report=config['duplicate_report']
-    )
+    tracer = telemetry.from_config(config)
+    if tracer:
+        config = dict(config, tracer=tracer,
+                      http_hooks=list(config.get('http_hooks') or []) + [tracer.on_request])
+        if tracer.profile:
+            # Only one profiler can be active at a time.
+            config['parallel_stages'] = False
+    ids = id_cache.open_cache(config, _endpoints(config)['major_unit'])
+    if ids and config.get('refresh_ids'):
+        print(" Refreshing cached unit and category IDs")
+        ids.invalidate()
+    config = dict(config, id_cache_store=ids)
+    client = build_client(config)
+    try:
+        if config.get('streaming'):
+            results = _run_streaming(config, client)
+        else:
+            results = _run_steps(config, client)
+    finally:
+        client.close()
+        if ids:
+            ids.close()
+        if tracer:
+            tracer.close()
     
-    # Step 5: Send Products
-    print("\n Step 5: Sending Products to API...")
-    print("-" * 40)
-    send_products.run(
-        products_file=config['sorted_file'],
+    print("\n" + "=" * 60)
+    print(" Pipeline Complete!")
+    if tracer:
+        tracer.summary()
+    return results
+
+
+def _endpoints(config):
+    return config.get('api_endpoints') or API_ENDPOINTS
+
+
+def _stage(config, name):
+    # config['stage_hook'] lets callers such as the benchmark suite wrap each
+    # step in their own context manager (timing, memory tracking, ...).
+    # The tracer, when enabled, is layered under it.
+    hook = config.get('stage_hook')
+    tracer = config.get('tracer')
+    if not tracer:
+        return hook(name) if hook else contextlib.nullcontext()
+    stack = contextlib.ExitStack()
+    stack.enter_context(tracer.stage(name))
+    if hook:
+        stack.enter_context(hook(name))
+    return stack
+
+
+def _run_steps(config, client):
+    # Stage graph:
+    #   load -> sort_products, sync_units, sync_categories -> validate_products
+    #        -> group_index ---------------------------------\
+    #   reconcile_products -----------------------------------> send_products
+    #   load -> check_duplicate_barcodes (report only)
+    endpoints = _endpoints(config)
+    graph = stage_graph.StageGraph()
+
+    def load(results):
+        print("\n Loading input file...")
+        with _stage(config, 'load'):
+            products_df = data_loader.load_products(config['input_file'])
+        print(f" Loaded {len(products_df)} rows")
+        return products_df
+
+    def sort(results):
+        print("\n Step 1: Sorting Products...")
+        with _stage(config, 'sort_products'):
+            return sort_products.run(
+                df=results['load'],
+                output_file=config['sorted_file'] if config.get('save_sorted') else None,
+                reset_index=not validating
+            )
+
+    def validate(results):
+        # Runs on the file as loaded, so the report points at spreadsheet
+        # rows. Invalid rows are dropped from the sorted frame afterwards,
+        # which keeps every other row at its position in the full sort: the
+        # row-index checkpoint of older upload caches relies on it.
+        print("\n Validating Products...")
+        with _stage(config, 'validate_products'):
+            clean = validate_products.run(
+                input_file=config['input_file'],
+                output_report=_validation_report(config),
+                units_mapping=config['units_mapping'],
+                categories_mapping=config['categories_mapping'],
+                df=results['load']
+            )
+            ordered = results['sort_products']
+            if clean is None or ordered is None:
+                return None
+            keep = ordered.index.isin(clean.index)
+            return ordered.reset_index(drop=True)[keep]
+
+    def units(results):
+        print("\n Step 2: Syncing Units...")
+        with _stage(config, 'sync_units'):
+            return sync_units.run(
+                input_file=config['input_file'],
+                output_mapping=config['units_mapping'],
+                token=config['token'],
+                api_base=endpoints['major_unit'],
+                headers=build_headers(config['token']),
+                client=client,
+                df=results['load'],
+                id_cache=config.get('id_cache_store')
+            )
+
+    def categories(results):
+        print("\n  Step 3: Syncing Categories...")
+        with _stage(config, 'sync_categories'):
+            return sync_categories.run(
+                input_file=config['input_file'],
+                output_mapping=config['categories_mapping'],
+                token=config['token'],
+                api_base=endpoints['category'],
+                headers=build_headers(config['token']),
+                client=client,
+                df=results['load'],
+                id_cache=config.get('id_cache_store')
+            )
+
+    def duplicates(results):
+        print("\n Step 4: Checking Duplicate Barcodes...")
+        with _stage(config, 'check_duplicate_barcodes'):
+            return check_duplicate_barcodes.run(
+                input_file=config['input_file'],
+                output_report=config['duplicate_report'],
+                df=results['load']
+            )
+
+    def send(results):
+        if config.get('compile_to'):
+            print("\n Step 5: Compiling Payloads...")
+            print("-" * 40)
+            with _stage(config, 'compile_payloads'):
+                return payload_artifact.compile_payloads(
+                    products(results), config['units_mapping'], config['categories_mapping'],
+                    config['compile_to'], tenant=id_cache.tenant_of(config['token'], endpoints['major_unit'])
+                )
+        print("\n Step 5: Sending Products to API...")
+        print("-" * 40)
+        with _stage(config, 'send_products'):
+            if config.get('upload_processes', 1) > 1:
+                return _send_distributed(config, results, products(results))
+            return send_products.run(
+                products_file=config['sorted_file'],
+                units_mapping=config['units_mapping'],
+                categories_mapping=config['categories_mapping'],
+                cache_file=config['upload_cache'],
+                tax_id=config['tax_id'],
+                stock_id=config['stock_id'],
+                token=config['token'],
+                api_base=endpoints['product'],
+                headers=build_headers(config['token'], include_content_type=False),
+                workers=config.get('upload_workers', 1),
+                client=client,
+                df=products(results),
+                remote_index=results.get('reconcile_products'),
+                payloads_file=config.get('payloads_file'),
+                dead_letter_file=config.get('dead_letter_file'),
+                group_index=results['group_index'],
+                skip_duplicates=config.get('skip_duplicates', True),
+                resend_changed=config.get('resend_changed', False)
+            )
+
+    validating = config.get('validate', True)
+    products_stage = 'validate_products' if validating else 'sort_products'
+
+    def products(results):
+        return results[products_stage]
+
+    graph.add('load', load)
+    graph.add('reconcile_products', lambda results: _reconcile(config, client))
+    graph.add('sync_units', units, deps=['load'])
+    graph.add('sync_categories', categories, deps=['load'])
+    graph.add('sort_products', sort, deps=['load'])
+    if validating:
+        graph.add('validate_products', validate, deps=['sort_products', 'sync_units', 'sync_categories'])
+    graph.add('group_index', lambda results: sort_products.GroupIndex.from_frame(products(results)),
+              deps=[products_stage])
+    graph.add('check_duplicate_barcodes', duplicates, deps=['load'])
+    graph.add('send_products', send,
+              deps=['group_index', 'sync_units', 'sync_categories', 'reconcile_products'])
+    return graph.run(workers=_stage_workers(config))
+
+
+def _send_distributed(config, results, df):
+    return distributed_upload.run(
+        df=df,
         units_mapping=config['units_mapping'],
         categories_mapping=config['categories_mapping'],
-        cache_file=config['upload_cache'],
+        store_path=config.get('shard_store') or str(Path(config['base_path']) / 'upload_shards.db'),
+        headers=build_headers(config['token'], include_content_type=False),
+        api_base=_endpoints(config)['product'],
         tax_id=config['tax_id'],
         stock_id=config['stock_id'],
-        token=config['token'],
-        api_base=API_ENDPOINTS['product'],
-        headers=build_headers(config['token'], include_content_type=False)
+        processes=config['upload_processes'],
+        workers=config.get('upload_workers', 1),
+        shard_size=config.get('shard_size', 500),
+        lease_seconds=config.get('lease_seconds', 60),
+        requests_per_second=config.get('requests_per_second', 10),
+        http_timeout=config.get('http_timeout', 30),
+        max_retries=config.get('max_retries', 5),
+        remote_index=results.get('reconcile_products'),
+        skip_duplicates=config.get('skip_duplicates', True),
+        resend_changed=config.get('resend_changed', False),
+        dead_letter_file=config.get('dead_letter_file'),
+        cache_file=config['upload_cache']
     )
-    
-    print("\n" + "=" * 60)
-    print(" Pipeline Complete!")
+
+
+def _stream_records(config, client, batch_size):
+    # Units and categories are synced batch by batch as new names appear, so
+    # the first products go out as soon as the first batch has been read
+    # instead of after a full pass over the file.
+    endpoints = _endpoints(config)
+    units_map, cats_map = {}, {}
+    syncs = [
+        (sync_units, 'unit', config['units_mapping'], endpoints['major_unit'], units_map),
+        (sync_categories, 'category', config['categories_mapping'], endpoints['category'], cats_map),
+    ]
+    seen = {column: set() for _, column, _, _, _ in syncs}
+
+    def resolve(batches):
+        for batch in batches:
+            for module, column, output_mapping, api_base, mapping in syncs:
+                names = set(batch[column].dropna().astype(str).str.strip()) - seen[column] - {''}
+                if not names:
+                    continue
+                module.run(
+                    input_file=config['input_file'],
+                    output_mapping=output_mapping,
+                    token=config['token'],
+                    api_base=api_base,
+                    headers=build_headers(config['token']),
+                    client=client,
+                    names=sorted(names),
+                    # The full listing is fetched once; later batches look
+                    # their few new names up one by one.
+                    prefetch=not seen[column],
+                    id_cache=config.get('id_cache_store'),
+                    mapping=mapping
+                )
+                seen[column] |= names
+            yield batch
+
+    batches = resolve(data_loader.iter_product_batches(config['input_file'], batch_size))
+    if config.get('validate', True):
+        batches = validate_products.filter_batches(batches, units_map, cats_map, _validation_report(config))
+    for batch in batches:
+        yield build_payloads.run(batch, units_map, cats_map, config['tax_id'], config['stock_id'])
+
+
+def _validation_report(config):
+    return config.get('validation_report') or str(Path(config['base_path']) / 'validation_report.xlsx')
+
+
+def _stage_workers(config):
+    # parallel_stages=False runs the graph one stage at a time, which keeps
+    # the console output of each step together.
+    return None if config.get('parallel_stages', True) else 1
+
+
+def _reconcile(config, client):
+    if not config.get('reconcile', True):
+        return None
+    print("\n Reconciling with existing remote products...")
+    with _stage(config, 'reconcile_products'):
+        return reconcile_products.run(
+            api_base=_endpoints(config)['product'],
+            headers=build_headers(config['token'], include_content_type=False),
+            client=client,
+            stock_id=config['stock_id']
+        )
+
+
+def _run_streaming(config, client):
+    # Sorting and the duplicate report need the whole sheet, so streaming mode
+    # skips them: the upload scheduler parks Type 5 rows until their base has
+    # been uploaded, whatever order they arrive in. Units and categories are
+    # synced inside the upload, one batch at a time.
+    endpoints = _endpoints(config)
+    batch_size = config.get('stream_batch_size', 1000)
+    graph = stage_graph.StageGraph()
+
+    def send(results):
+        print("\n Streaming Products to API...")
+        print("-" * 40)
+        with _stage(config, 'send_products'):
+            return send_products.run(
+                products_file=config['input_file'],
+                units_mapping=None,
+                categories_mapping=None,
+                cache_file=config['upload_cache'],
+                tax_id=config['tax_id'],
+                stock_id=config['stock_id'],
+                token=config['token'],
+                api_base=endpoints['product'],
+                headers=build_headers(config['token'], include_content_type=False),
+                workers=config.get('upload_workers', 1),
+                client=client,
+                batches=_stream_records(config, client, batch_size),
+                remote_index=results.get('reconcile_products'),
+                payloads_file=config.get('payloads_file'),
+                dead_letter_file=config.get('dead_letter_file'),
+                skip_duplicates=config.get('skip_duplicates', True),
+                resend_changed=config.get('resend_changed', False),
+                journal=upload_journal.UploadJournal(
+                    config['upload_cache'], index_path=config.get('stream_upload_cache') or ''
+                )
+            )
+
+    graph.add('reconcile_products', lambda results: _reconcile(config, client))
+    graph.add('send_products', send, deps=['reconcile_products'])
+    return graph.run(workers=_stage_workers(config))
+
+
+def run_fan_out(config, artifact, destinations):
+    # Destinations without a token of their own use the configured one. The
+    # configured account and stock keep the regular checkpoint files; every
+    # other destination gets its own under base_path.
+    endpoints = _endpoints(config)
+    header = payload_artifact.read_header(artifact)
+    home = id_cache.tenant_of(config['token'], endpoints['major_unit'])
+    compiled_for = header.get('tenant') or home
+    base_path = Path(config['base_path'])
+    clients, resolvers, prepared = {}, {}, []
+    with contextlib.ExitStack() as stack:
+        for destination in destinations:
+            account = dict(config, token=destination.get('token') or config['token'])
+            tenant = id_cache.tenant_of(account['token'], endpoints['major_unit'])
+            if tenant not in clients:
+                clients[tenant] = stack.enter_context(contextlib.closing(build_client(account)))
+            if tenant != compiled_for and tenant not in resolvers:
+                if header['version'] < 2:
+                    print(f" {artifact} has no unit and category names; recompile it to upload into another account")
+                    return None
+                resolvers[tenant] = _account_ids(account, clients[tenant], stack)
+            if tenant == home and str(destination['stock_id']) == str(config['stock_id']):
+                cache_file, dead_letter_file = config['upload_cache'], config['dead_letter_file']
+            else:
+                suffix = payload_artifact.destination_suffix(destination['stock_id'],
+                                                             None if tenant == home else tenant)
+                cache_file = str(base_path / f"upload_cache_{suffix}.json")
+                dead_letter_file = str(base_path / f"failed_products_{suffix}.jsonl")
+            prepared.append({
+                'stock_id': str(destination['stock_id']),
+                'tax_id': str(destination['tax_id']),
+                'tenant': tenant,
+                'headers': build_headers(account['token'], include_content_type=False),
+                'client': clients[tenant],
+                'cache_file': cache_file,
+                'dead_letter_file': dead_letter_file,
+                'resolve': resolvers.get(tenant),
+            })
+        return payload_artifact.fan_out(
+            artifact,
+            prepared,
+            api_base=endpoints['product'],
+            workers=config.get('upload_workers', 1),
+            batch_size=config.get('stream_batch_size', 1000),
+            skip_duplicates=config.get('skip_duplicates', True),
+            resend_changed=config.get('resend_changed', False),
+            reconcile=config.get('reconcile', True),
+            same_account=config.get('same_account_stocks', 'upload')
+        )
+
+
+def _account_ids(config, client, stack):
+    # Resolves the artifact's unit and category names in another account,
+    # creating the missing ones there, batch by batch like streaming mode.
+    endpoints = _endpoints(config)
+    suffix = payload_artifact.account_suffix(id_cache.tenant_of(config['token'], endpoints['major_unit']))
+    store = id_cache.open_cache(config, endpoints['major_unit'])
+    if store:
+        stack.callback(store.close)
+    units_map, cats_map = {}, {}
+    syncs = [
+        (sync_units, 'unit_name', config['units_mapping'], endpoints['major_unit'], units_map),
+        (sync_categories, 'category_name', config['categories_mapping'], endpoints['category'], cats_map),
+    ]
+    lock = threading.Lock()
+
+    def resolve(records):
+        with lock:
+            for module, field, output_mapping, api_base, mapping in syncs:
+                names = {record.get(field) for record in records} - set(mapping) - {'', None}
+                if not names:
+                    continue
+                module.run(
+                    input_file=None,
+                    output_mapping=str(Path(output_mapping).with_name(f"{Path(output_mapping).stem}_{suffix}.json")),
+                    token=config['token'],
+                    api_base=api_base,
+                    headers=build_headers(config['token']),
+                    client=client,
+                    names=sorted(names),
+                    prefetch=not mapping,
+                    id_cache=store,
+                    mapping=mapping
+                )
+        payload_artifact.apply_ids(records, units_map, cats_map)
+
+    return resolve
+
+
+def run_retry(config, include_permanent=False):
+    client = build_client(config)
+    try:
+        return send_products.retry_failed(
+            dead_letter_file=config['dead_letter_file'],
+            cache_file=config['upload_cache'],
+            api_base=_endpoints(config)['product'],
+            headers=build_headers(config['token'], include_content_type=False),
+            workers=config.get('upload_workers', 1),
+            client=client,
+            include_permanent=include_permanent
+        )
+    finally:
+        client.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload product workbooks to Fatoorah.")
+    parser.add_argument('--manifest', help="JSON manifest of (file, token, stock_id, tax_id) jobs to run "
+                                           "without prompts")
+    parser.add_argument('--processes', type=int, default=4, help="Jobs to run in parallel (default: 4)")
+    parser.add_argument('--report', help="Consolidated report path (default: <output_dir>/batch_report.xlsx)")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Replay only the products in failed_products.jsonl, transient failures first")
+    parser.add_argument('--include-permanent', action='store_true',
+                        help="With --retry-failed, also replay permanent failures (after fixing them)")
+    parser.add_argument('--compile', metavar='ARTIFACT',
+                        help="Sync units/categories and write all payloads to ARTIFACT (.jsonl or .jsonl.gz) "
+                             "instead of uploading")
+    parser.add_argument('--fan-out', metavar='ARTIFACT',
+                        help="Upload a compiled artifact to every destination in --destinations at once")
+    parser.add_argument('--destinations',
+                        help="Comma-separated stock_id:tax_id pairs for --fan-out; add :TOKEN_ENV to upload a "
+                             "destination with the token in that environment variable (another account)")
+    parser.add_argument('--same-account', choices=('upload', 'skip'),
+                        help="For several --destinations stocks of one account: upload every stock (default) or "
+                             "only the first")
+    parser.add_argument('--resend-changed', action='store_true',
+                        help="Also upload rows edited since their last upload (the API creates a new product "
+                             "for each; the old one is left as it is)")
+    parser.add_argument('--send-duplicate-barcodes', action='store_true',
+                        help="Send every row with a repeated barcode instead of only the first")
+    parser.add_argument('--refresh-ids', action='store_true',
+                        help="Ignore cached unit and category IDs for this account and look them up again")
+    parser.add_argument('--upload-worker', metavar='STORE',
+                        help="Join a distributed upload as an extra worker (token from FATOORAH_TOKEN or a prompt)")
+    return parser.parse_args(argv)
 
 
 def main():
-    config = get_user_input()
+    args = parse_args()
+    if args.manifest:
+        rows = batch_runner.run(args.manifest, run_pipeline, build_config,
+                                processes=args.processes, report_path=args.report, endpoints=API_ENDPOINTS)
+        sys.exit(0 if all(row['status'] == 'ok' for row in rows) else 1)
+
+    if args.upload_worker:
+        token = os.environ.get('FATOORAH_TOKEN') or input("\n Enter API Token: ").strip()
+        distributed_upload.work(args.upload_worker, build_headers(token, include_content_type=False))
+        return
+
+    overrides = {}
+    if args.resend_changed:
+        overrides['resend_changed'] = True
+    if args.send_duplicate_barcodes:
+        overrides['skip_duplicates'] = False
+
+    if args.same_account:
+        overrides['same_account_stocks'] = args.same_account
+
+    if args.fan_out:
+        if not args.destinations:
+            print(" --fan-out needs --destinations, e.g. --destinations 1:5,2:5")
+            sys.exit(1)
+        destinations = payload_artifact.parse_destinations(args.destinations)
+        run_fan_out(dict(get_user_input(ask_file=False), **overrides), args.fan_out, destinations)
+        return
+
+    if args.retry_failed:
+        run_retry(get_user_input(ask_file=False), include_permanent=args.include_permanent)
+        return
+
+    config = dict(get_user_input(), **overrides)
+    if args.compile:
+        # Products are not uploaded, so there is nothing to reconcile.
+        config['compile_to'] = args.compile
+        config['reconcile'] = False
+    config['refresh_ids'] = args.refresh_ids
     
     print("\n Configuration:")
     print(f"  - Input File: {config['input_file']}")
@@ -2,4 +2,21 @@ from . import sort_products
 from . import sync_categories
 from . import sync_units
 from . import check_duplicate_barcodes
-from . import send_products
\ No newline at end of file
+from . import send_products
+from . import api_client
+from . import build_payloads
+from . import data_loader
+from . import rate_limiter
+from . import reconcile_products
+from . import upload_journal
+from . import upload_scheduler
+from . import telemetry
+from . import stage_graph
+from . import batch_runner
+from . import sqlite_util
+from . import shard_store
+from . import distributed_upload
+from . import dead_letter
+from . import payload_artifact
+from . import validate_products
+from . import id_cache
@@ -0,0 +1,166 @@
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LookupFailed(Exception):
+    # A create failed and the lookup for it failed too, so the product may
+    # or may not exist remotely.
+    pass
+
+
+class ApiClient:
+    # One pooled, keep-alive session shared by every pipeline stage. Transient
+    # failures (429, 5xx, connection errors and timeouts) are retried with
+    # exponential backoff and full jitter, honouring Retry-After when sent.
+    # Every attempt first takes a token from the optional shared RateLimiter
+    # and reports its outcome back so the limiter can adapt. Hooks are called
+    # once per finished request as hook(method, url, response, elapsed,
+    # attempts); response is None when the request raised.
+
+    def __init__(self, headers, timeout=30, max_retries=5, backoff=0.5, max_backoff=30, pool_size=16,
+                 rate_limiter=None, hooks=None):
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.hooks = list(hooks or [])
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, retry=True, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = self.max_retries + 1 if retry else 1
+        first_started = time.monotonic()
+
+        for attempt in range(1, attempts + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.rate_limiter:
+                    self.rate_limiter.record(None, time.monotonic() - started)
+                if attempt == attempts:
+                    self._notify(method, url, None, time.monotonic() - first_started, attempt)
+                    raise
+                delay = self.retry_delay(attempt)
+                print(f"  -> {method} {url} failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if self.rate_limiter:
+                self.rate_limiter.record(resp.status_code, time.monotonic() - started)
+
+            if resp.status_code in RETRY_STATUSES and attempt < attempts:
+                delay = self.retry_delay(attempt, resp)
+                print(f"  -> {method} {url} returned {resp.status_code}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._notify(method, url, resp, time.monotonic() - first_started, attempt)
+            return resp
+
+    def create(self, url, lookup, is_duplicate=None, resumed=False, **kwargs):
+        # POSTs a non-idempotent create without blind retries. After a
+        # timeout, dropped connection or 5xx the server may have saved it
+        # anyway, so lookup() is asked before each retry and after the last
+        # attempt, and the id it finds is used instead of posting again.
+        # resumed asks before the first attempt too (the create was in flight
+        # when an earlier run stopped). is_duplicate(resp) flags a duplicate
+        # refusal; after an earlier attempt it may be this very create, so it
+        # is looked up as well. A lookup that fails raises LookupFailed:
+        # whether the create exists is then unknown. Returns
+        # (response, None) or (None, existing_id).
+        if resumed:
+            existing_id = self._lookup(lookup)
+            if existing_id:
+                return None, existing_id
+        attempts = self.max_retries + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                resp = self.post(url, retry=False, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == attempts:
+                    existing_id = self._lookup(lookup)
+                    if existing_id:
+                        return None, existing_id
+                    raise
+                resp = None
+                reason = type(e).__name__
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    if is_duplicate and (attempt > 1 or resumed) and is_duplicate(resp):
+                        existing_id = self._lookup(lookup)
+                        if existing_id:
+                            return None, existing_id
+                    return resp, None
+                reason = resp.status_code
+            if resp is None or resp.status_code != 429:
+                existing_id = self._lookup(lookup)
+                if existing_id:
+                    return None, existing_id
+            if attempt == attempts:
+                return resp, None
+            delay = self.retry_delay(attempt, resp)
+            print(f"  -> POST {url} failed ({reason}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _lookup(self, lookup):
+        try:
+            return lookup()
+        except Exception as e:
+            raise LookupFailed(f"could not check whether the create was saved ({e})") from e
+
+    def fetch_all(self, url, per_page=100, params=None):
+        # Pages through a Fatoorah /all listing using pagination.total_pages.
+        items = []
+        page = 1
+        total_pages = 1
+        while page <= total_pages:
+            query = dict(params or {}, page=page, per_page=per_page, limit=per_page)
+            resp = self.get(url, params=query)
+            resp.raise_for_status()
+            body = resp.json().get('data') or {}
+            if isinstance(body, list):
+                items.extend(body)
+                break
+            items.extend(body.get('data') or [])
+            total_pages = int((body.get('pagination') or {}).get('total_pages') or 1)
+            page += 1
+        return items
+
+    def close(self):
+        self.session.close()
+
+    def _notify(self, method, url, resp, elapsed, attempts):
+        for hook in self.hooks:
+            try:
+                hook(method, url, resp, elapsed, attempts)
+            except Exception as e:
+                print(f"  -> Request hook failed: {e}")
+
+    def retry_delay(self, attempt, resp=None):
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
@@ -0,0 +1,169 @@
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from .data_loader import save_products
+from .id_cache import tenant_of
+
+
+REQUIRED_JOB_KEYS = ('file', 'stock_id', 'tax_id')
+REPORT_COLUMNS = ['job', 'tenant', 'file', 'stock_id', 'tax_id', 'status', 'success', 'failed',
+                  'skipped', 'duplicates', 'unchanged', 'changed', 'adopted', 'seconds', 'log', 'error']
+
+
+def load_manifest(path):
+    # A manifest is either a list of jobs or an object with "jobs" plus
+    # optional "defaults" (config overrides for every job), "tenant_rps"
+    # (requests/sec budget per tenant) and "output_dir". Each job needs file,
+    # stock_id, tax_id and either token or token_env (an environment variable
+    # holding the token). Any other key is passed through as a config override.
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    if not manifest.get('jobs'):
+        raise ValueError(f"{path} does not contain any jobs")
+    return manifest
+
+
+def plan_jobs(manifest, manifest_dir, build_config, processes, endpoints=None):
+    root = Path(manifest_dir)
+    defaults = dict(manifest.get('defaults', {}))
+    output_dir = root / manifest.get('output_dir', 'batch_runs')
+    default_rps = defaults.pop('requests_per_second', 10)
+    # Every job shares one ID cache unless the manifest says otherwise.
+    defaults.setdefault('id_cache', os.environ.get('FATOORAH_ID_CACHE') or str(output_dir / 'id_cache.db'))
+    tenant_rps = manifest.get('tenant_rps', {})
+
+    jobs = []
+    names = set()
+    for i, job in enumerate(manifest['jobs'], 1):
+        job = dict(job)
+        missing = [key for key in REQUIRED_JOB_KEYS if not job.get(key)]
+        token = job.pop('token', None) or os.environ.get(job.pop('token_env', ''), '')
+        if not token:
+            missing.append('token')
+        if missing:
+            raise ValueError(f"Job {i} is missing {', '.join(missing)}")
+
+        input_file = root / job.pop('file')
+        name = str(job.pop('name', f"{input_file.stem}_{job['stock_id']}"))
+        unique = name
+        suffix = 2
+        while unique in names:
+            unique = f"{name}_{suffix}"
+            suffix += 1
+        names.add(unique)
+
+        tenant = job.pop('tenant', '')
+        rps = job.pop('requests_per_second', None)
+        overrides = dict(defaults, **job)
+        stock_id = str(overrides.pop('stock_id'))
+        tax_id = str(overrides.pop('tax_id'))
+        config = build_config(token, tax_id, stock_id, output_dir / unique, input_file, **overrides)
+        if not tenant:
+            # Same tenant as the ID cache: tokens of one account share a budget.
+            api_base = (config.get('api_endpoints') or endpoints or {}).get('major_unit', '')
+            tenant = tenant_of(token, api_base)
+        jobs.append({
+            'job': unique,
+            'tenant': str(tenant),
+            'file': str(input_file),
+            'rps': rps,
+            'config': config,
+        })
+
+    # Jobs of one tenant share that tenant's request budget. At most
+    # `processes` of them run at once, so the budget is split between that
+    # many, and every job gets its own rate limiter in its own process.
+    per_tenant = {}
+    for job in jobs:
+        per_tenant[job['tenant']] = per_tenant.get(job['tenant'], 0) + 1
+    for job in jobs:
+        budget = float(tenant_rps.get(job['tenant'], default_rps))
+        sharing = max(1, min(per_tenant[job['tenant']], processes))
+        job['config']['requests_per_second'] = job.pop('rps') or budget / sharing
+    return jobs, output_dir
+
+
+def run(manifest_path, pipeline, build_config, processes=4, report_path=None, endpoints=None):
+    manifest = load_manifest(manifest_path)
+    processes = max(1, int(processes))
+    jobs, output_dir = plan_jobs(manifest, Path(manifest_path).parent, build_config, processes, endpoints)
+    report_path = report_path or str(output_dir / 'batch_report.xlsx')
+
+    print(f"Running {len(jobs)} job(s) with {processes} process(es)...")
+    rows = []
+    with ProcessPoolExecutor(max_workers=min(processes, len(jobs))) as pool:
+        futures = {pool.submit(run_job, pipeline, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                row = _report_row(job, 'error', error=str(e))
+            rows.append(row)
+            print(f"  [{row['status']}] {row['job']}: success {row['success']}, failed {row['failed']} "
+                  f"({row['seconds']}s)")
+
+    order = {job['job']: i for i, job in enumerate(jobs)}
+    rows.sort(key=lambda row: order[row['job']])
+    report = pd.DataFrame(rows, columns=REPORT_COLUMNS)
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    save_products(report, report_path)
+
+    ok = sum(1 for row in rows if row['status'] == 'ok')
+    print(f"\n{'=' * 60}")
+    print(f"Batch complete: {ok}/{len(rows)} job(s) succeeded")
+    print(f"Uploaded: {int(report['success'].sum())}, Failed: {int(report['failed'].sum())}")
+    print(f"Report saved to: {report_path}")
+    return rows
+
+
+def run_job(pipeline, job):
+    # Runs one pipeline in its own directory. The job's console output goes
+    # to pipeline.log there so parallel jobs do not interleave.
+    config = job['config']
+    os.makedirs(config['base_path'], exist_ok=True)
+    log_path = os.path.join(str(config['base_path']), 'pipeline.log')
+    started = time.perf_counter()
+    try:
+        with open(log_path, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            results = pipeline(config)
+    except Exception as e:
+        return _report_row(job, 'error', started=started, log=log_path, error=str(e))
+
+    counts = (results or {}).get('send_products')
+    if not isinstance(counts, dict):
+        return _report_row(job, 'failed', started=started, log=log_path,
+                           error='Upload did not run; see the log')
+    status = 'ok' if not counts.get('failed') else 'partial'
+    return _report_row(job, status, counts, started=started, log=log_path)
+
+
+def _report_row(job, status, counts=None, started=None, log=None, error=None):
+    counts = counts or {}
+    config = job['config']
+    return {
+        'job': job['job'],
+        'tenant': job['tenant'],
+        'file': job['file'],
+        'stock_id': config['stock_id'],
+        'tax_id': config['tax_id'],
+        'status': status,
+        'success': counts.get('success', 0),
+        'failed': counts.get('failed', 0),
+        'skipped': counts.get('skipped', 0),
+        'duplicates': counts.get('duplicates', 0),
+        'unchanged': counts.get('unchanged', 0),
+        'changed': counts.get('changed', 0),
+        'adopted': counts.get('adopted', 0),
+        'seconds': round(time.perf_counter() - started, 2) if started else None,
+        'log': log,
+        'error': error,
+    }
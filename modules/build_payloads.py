@@ -0,0 +1,143 @@
+import hashlib
+import json
+
+import pandas as pd
+
+from .sort_products import normalize_names
+
+
+DEFAULT_UNIT_ID = 14656
+DEFAULT_CATEGORY_ID = 4470
+TAX_RATE = 1.15
+
+
+def run(df, units_map, cats_map, tax_id, stock_id):
+    # Cleans and converts every column once and returns ready-to-send records:
+    # {"index", "name", "group", "product_type", "barcode", "key",
+    # "fingerprint", "payload"} plus an "error" message for rows that cannot
+    # be sent (the old loop raised on those). "group" is the normalized name
+    # that links Type 5 rows to their Type 1 base, "key" identifies the
+    # product independently of its row position and "fingerprint" changes
+    # whenever its payload does.
+    if df.empty:
+        return []
+
+    names = _column(df, 'name').fillna('').astype(str).str.strip()
+    product_types = pd.to_numeric(_column(df, 'product_type'), errors='coerce')
+    # Fractional or infinite types become NaN so only their own row fails.
+    product_types = product_types.where(product_types % 1 == 0)
+    barcodes = normalize_barcodes(_column(df, 'bar_code'))
+
+    sale_raw = _column(df, 'sale_price')
+    sale_prices = pd.to_numeric(sale_raw, errors='coerce')
+    bad_price = sale_raw.notna() & sale_prices.isna()
+
+    unit_names = _column(df, 'unit').astype(str).str.strip()
+    cat_names = _column(df, 'category').astype(str).str.strip()
+    unit_ids = _map_ids(unit_names, units_map, DEFAULT_UNIT_ID)
+    cat_ids = _map_ids(cat_names, cats_map, DEFAULT_CATEGORY_ID)
+
+    fields = pd.DataFrame({
+        "name": names,
+        "buyPrice": _text_or(_column(df, 'buy_price'), "0"),
+        "salePrice": _text(sale_raw),
+        "defaultParCode": barcodes,
+        "unit_id": unit_ids,
+        "first_quantity": _text_or(_column(df, 'first_quantity'), "0"),
+        "main_cat_id": cat_ids,
+        "product_type": product_types.astype('Int64').astype(str),
+        "salePriceWithTax": _text(sale_prices * TAX_RATE),
+    }, index=df.index)
+    constants = {
+        "type": "1",
+        "stock_id": str(stock_id),
+        "is_active": "1",
+        "is_unique": "0",
+        "standard_barcode_type": "gs1",
+        "tag_id": "1",
+        "status": "1",
+        "is_online": "1",
+        "price_including_tax": "0",
+        "unifiedBarcodeType": "1212",
+        "tax[0][type]": "main",
+        "tax[0][id]": str(tax_id)
+    }
+    conversion = _text_or(_column(df, 'Conversion_rate'), "1")
+    groups = normalize_names(names)
+    keys = product_keys(groups, product_types, unit_names, barcodes)
+
+    records = []
+    types = product_types.astype('Int64')
+    for index, row, p_type, conv, price_error, key, group in zip(
+            df.index, fields.to_dict('records'), types, conversion, bad_price, keys, groups):
+        payload = {**row, **constants}
+        record = {
+            "index": index,
+            "name": row["name"],
+            "group": group,
+            "product_type": None if pd.isna(p_type) else int(p_type),
+            "barcode": row["defaultParCode"],
+            "conversion_rate": conv,
+            "key": key,
+            "fingerprint": fingerprint(payload, conv),
+            "payload": payload,
+        }
+        if record["product_type"] is None:
+            record["error"] = f"invalid product_type for {row['name']!r}"
+        elif price_error:
+            record["error"] = f"invalid sale_price for {row['name']!r}"
+        records.append(record)
+    return records
+
+
+def normalize_barcodes(values):
+    # Strips whitespace and the ".0" pandas adds when a barcode column is read
+    # as floats; missing barcodes become "".
+    text = values.astype(str).str.strip()
+    is_float = values.map(lambda v: isinstance(v, float))
+    text = text.where(~is_float, text.str.replace(r'\.0$', '', regex=True))
+    return text.where(values.notna(), "")
+
+
+def product_keys(groups, product_types, unit_names, barcodes):
+    # The barcode identifies a product; rows without one fall back to the
+    # normalized name group plus type and unit. Repeats of the same key get an
+    # occurrence suffix so each row stays distinct.
+    by_name = ("name:" + groups + "|" + product_types.astype('Int64').astype(str).fillna("")
+               + "|" + unit_names.fillna("").str.lower())
+    keys = by_name.where(barcodes == "", "bc:" + barcodes)
+    occurrence = keys.groupby(keys, sort=False).cumcount()
+    return keys + ("#" + occurrence.astype(str)).where(occurrence > 0, "")
+
+
+def fingerprint(payload, conversion_rate="1"):
+    # Hash of everything that is sent for the row. The Type 1 base id of a
+    # Type 5 row is added at send time and deliberately left out.
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False) + "|" + str(conversion_rate)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def write_payloads(records, out):
+    # One JSON line per record; out is an open text file so batches can be
+    # appended as they are built.
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def _column(df, name):
+    if name in df.columns:
+        return df[name]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _text(values):
+    return values.astype(str).fillna('nan')
+
+
+def _text_or(values, default):
+    return values.astype(str).where(values.notna(), default)
+
+
+def _map_ids(names, mapping, default):
+    mapping = {str(k).strip(): v for k, v in mapping.items()}
+    return names.map(lambda name: mapping.get(name, default)).astype(str)
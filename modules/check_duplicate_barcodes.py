@@ -1,15 +1,18 @@
 import pandas as pd
-from collections import Counter
 
+from .build_payloads import normalize_barcodes
+from .data_loader import load_products
 
-def run(input_file, output_report):
 
-    print("Loading Excel file...")
-    try:
-        df = pd.read_excel(input_file)
-    except Exception as e:
-        print(f"Error loading file: {e}")
-        return False
+def run(input_file, output_report, df=None):
+
+    if df is None:
+        print("Loading Excel file...")
+        try:
+            df = load_products(input_file)
+        except Exception as e:
+            print(f"Error loading file: {e}")
+            return False
     
     print(f"Total products: {len(df)}")
     
@@ -17,38 +20,37 @@ def run(input_file, output_report):
         print("Error: 'bar_code' column not found")
         return False
     
-    df_with_barcodes = df[df['bar_code'].notna()].copy()
-    df_with_barcodes['bar_code'] = df_with_barcodes['bar_code'].astype(str).str.strip()
+    result_df = find_duplicates(df)
     
-    df_with_barcodes = df_with_barcodes[df_with_barcodes['bar_code'] != '']
-    df_with_barcodes = df_with_barcodes[df_with_barcodes['bar_code'] != 'nan']
-    
-    print(f"Products with barcodes: {len(df_with_barcodes)}")
-    
-    barcode_counts = Counter(df_with_barcodes['bar_code'])
-    duplicate_barcodes = {barcode: count for barcode, count in barcode_counts.items() if count > 1}
-    
-    if not duplicate_barcodes:
+    if result_df.empty:
         print("\n No duplicate barcodes found!")
         return True
     
-    print(f"\n  Found {len(duplicate_barcodes)} duplicate barcodes")
-    print(f"Total duplicate entries: {sum(duplicate_barcodes.values())}")
+    group_sizes = result_df.drop_duplicates('bar_code')['duplicate_count']
+    print(f"\n  Found {len(group_sizes)} duplicate barcodes")
+    print(f"Total duplicate entries: {int(group_sizes.sum())}")
     
-    duplicate_rows = []
-    for barcode, count in sorted(duplicate_barcodes.items(), key=lambda x: x[1], reverse=True):
-        rows = df_with_barcodes[df_with_barcodes['bar_code'] == barcode].copy()
-        rows['duplicate_count'] = count
-        duplicate_rows.append(rows)
+    important_cols = ['bar_code', 'duplicate_count', 'name', 'product_type', 'sale_price', 'buy_price']
+    other_cols = [col for col in result_df.columns if col not in important_cols]
+    result_df = result_df[important_cols + other_cols]
     
-    if duplicate_rows:
-        result_df = pd.concat(duplicate_rows, ignore_index=True)
-        
-        important_cols = ['bar_code', 'duplicate_count', 'name', 'product_type', 'sale_price', 'buy_price']
-        other_cols = [col for col in result_df.columns if col not in important_cols]
-        result_df = result_df[important_cols + other_cols]
-        
-        result_df.to_excel(output_report, index=False)
-        print(f"\n Report saved to: {output_report}")
+    result_df.to_excel(output_report, index=False)
+    print(f"\n Report saved to: {output_report}")
         
     return True
+
+
+def find_duplicates(df):
+    # Single pass: every row whose barcode occurs more than once, with its
+    # group size, most-duplicated barcodes first and file order within a group.
+    df_with_barcodes = df.assign(bar_code=normalize_barcodes(df['bar_code']))
+    df_with_barcodes = df_with_barcodes[~df_with_barcodes['bar_code'].isin(['', 'nan'])]
+    
+    print(f"Products with barcodes: {len(df_with_barcodes)}")
+    
+    barcodes = df_with_barcodes['bar_code']
+    duplicates = df_with_barcodes[barcodes.duplicated(keep=False)].copy()
+    duplicates['duplicate_count'] = duplicates.groupby('bar_code', sort=False)['bar_code'].transform('size')
+    duplicates['_first_seen'] = pd.factorize(duplicates['bar_code'])[0]
+    duplicates.sort_values(['duplicate_count', '_first_seen'], ascending=[False, True], kind='stable', inplace=True)
+    return duplicates.drop(columns=['_first_seen']).reset_index(drop=True)
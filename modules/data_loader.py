@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pandas as pd
+
+
+def load_products(path):
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return pd.read_csv(path)
+    if suffix == '.parquet':
+        return pd.read_parquet(path)
+    if suffix == '.feather':
+        return pd.read_feather(path)
+    return pd.read_excel(path)
+
+
+def save_products(df, path):
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        df.to_csv(path, index=False)
+    elif suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    elif suffix == '.feather':
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_excel(path, index=False)
+
+
+REQUIRED_COLUMNS = ['name', 'product_type']
+OPTIONAL_COLUMNS = ['unit', 'category', 'bar_code', 'buy_price', 'sale_price', 'first_quantity', 'Conversion_rate']
+
+
+def iter_product_batches(path, batch_size=1000):
+    # Yields cleaned frames of at most batch_size rows without ever holding the
+    # whole sheet in memory. Row indices are positions in the source file.
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        start = 0
+        for chunk in pd.read_csv(path, chunksize=batch_size):
+            chunk.index = range(start, start + len(chunk))
+            start += len(chunk)
+            yield _clean_batch(chunk)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+        _check_columns(header)
+
+        batch = []
+        start = 0
+        for values in rows:
+            batch.append(values)
+            if len(batch) >= batch_size:
+                yield _clean_batch(_frame(batch, header, start))
+                start += len(batch)
+                batch = []
+        if batch:
+            yield _clean_batch(_frame(batch, header, start))
+    finally:
+        workbook.close()
+
+
+def _frame(rows, header, start):
+    rows = [tuple(r[:len(header)]) + (None,) * (len(header) - len(r)) for r in rows]
+    return pd.DataFrame(rows, columns=header, index=range(start, start + len(rows)))
+
+
+def _check_columns(columns):
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+
+def _clean_batch(df):
+    _check_columns(df.columns)
+    df = df.dropna(how='all')
+    for col in OPTIONAL_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df['name'] = df['name'].fillna('').astype(str)
+    df['product_type'] = pd.to_numeric(df['product_type'], errors='coerce').fillna(999)
+    return df
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+TRANSIENT_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def classify_error(reason, status=None):
+    # Transient failures are worth replaying as-is: network errors, timeouts,
+    # throttling, server errors, and Type 5 rows whose base failed (they are
+    # replayed after their base, or wait for it). Permanent ones need the row fixed: duplicate
+    # barcodes, invalid rows, and requests the API rejected.
+    if reason in ('exception', 'missing_base'):
+        return TRANSIENT
+    if reason == 'http_error':
+        return TRANSIENT if status is None or status in TRANSIENT_STATUSES else PERMANENT
+    return PERMANENT
+
+
+class DeadLetterQueue:
+    # JSON Lines file with one entry per failed product: the record needed to
+    # replay it (key, payload, conversion rate, ...) plus the classified error
+    # and the API response. checkpoint names the journal the failing run
+    # recorded into, so a retry records into the same one.
+
+    def __init__(self, path, checkpoint=None):
+        self.path = path
+        self.checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._file = None
+
+    def add(self, record, reason, message='', response=None):
+        status = response.status_code if response is not None else None
+        entry = {
+            "key": record.get('key'),
+            "index": record.get('index'),
+            "name": record.get('name'),
+            "group": record.get('group'),
+            "product_type": record.get('product_type'),
+            "barcode": record.get('barcode'),
+            "fingerprint": record.get('fingerprint'),
+            "conversion_rate": record.get('conversion_rate'),
+            "payload": record.get('payload'),
+            "reason": reason,
+            "category": classify_error(reason, status),
+            "message": message,
+            "status": status,
+            "response": response.text[:2000] if response is not None else None,
+            "failed_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        if record.get('error'):
+            entry["error"] = record['error']
+        if self.checkpoint:
+            entry["checkpoint"] = self.checkpoint
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def load(path):
+    # Latest entry per product key, in first-failure order.
+    entries = {}
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            key = entry.get('key') or f"index:{entry.get('index')}"
+            entries[key] = entry
+    return list(entries.values())
+
+
+def replay_order(entries, include_permanent=False):
+    # Type 1 rows before Type 5 rows, transient failures first within each.
+    # A Type 5 row whose base failed can only succeed after the base, so it
+    # stays behind with a base that is not replayed.
+    selected = [e for e in entries if include_permanent or e['category'] == TRANSIENT]
+    replayed = {id(e) for e in selected}
+    held = {e.get('group') for e in entries
+            if e.get('product_type') == 1 and e.get('group') and id(e) not in replayed}
+    selected = [e for e in selected if not (e['reason'] == 'missing_base' and e.get('group') in held)]
+    rank = {TRANSIENT: 0, PERMANENT: 1}
+    return sorted(selected, key=lambda e: (e.get('product_type') != 1, rank.get(e['category'], 1)))
+
+
+def summarize(entries):
+    summary = {}
+    for entry in entries:
+        label = f"{entry['category']}/{entry['reason']}"
+        summary[label] = summary.get(label, 0) + 1
+    return summary
@@ -0,0 +1,257 @@
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from . import build_payloads, send_products
+from .api_client import ApiClient
+from .rate_limiter import RateLimiter
+from .shard_store import ShardJournal, ShardStore
+from .sort_products import normalize_name
+from .upload_journal import UploadJournal
+
+
+def run(df, units_mapping, categories_mapping, store_path, headers, api_base, tax_id, stock_id,
+        processes=4, workers=4, shard_size=500, lease_seconds=60, requests_per_second=10,
+        http_timeout=30, max_retries=5, remote_index=None, skip_duplicates=True, resend_changed=False,
+        dead_letter_file=None, cache_file=None):
+    # Coordinator: builds every payload once, applies the checks that need the
+    # whole file (in-file duplicate barcodes, products that already exist
+    # remotely), splits the rest into shards of whole name groups so each
+    # Type 5 row travels with its Type 1 base, and then runs `processes` local
+    # workers. More workers can join from other machines with work().
+    # cache_file is the regular upload checkpoint: products it already holds
+    # are not planned, and the store's results are written back to it.
+    try:
+        with open(units_mapping, 'r', encoding='utf-8') as f:
+            units_map = json.load(f)
+        with open(categories_mapping, 'r', encoding='utf-8') as f:
+            cats_map = json.load(f)
+    except Exception as e:
+        print(f"Error loading files: {e}")
+        return False
+
+    store = ShardStore(store_path)
+    # The checkpoint in the store only holds for one destination, and
+    # unfinished shards are only resumed for the same input.
+    target = {'api_base': api_base, 'stock_id': str(stock_id), 'tax_id': str(tax_id)}
+    known = store.get_meta('target')
+    if known and known != target:
+        print(f"{store_path} belongs to an upload to stock {known['stock_id']} (tax {known['tax_id']}) "
+              f"at {known['api_base']}; use another base path or shard_store for this one")
+        store.close()
+        return False
+    store.set_meta('target', target)
+    journal = UploadJournal(cache_file) if cache_file else None
+    if journal is not None:
+        _seed(store, journal)
+
+    counts = {'skipped': 0, 'duplicates': 0}
+    records = build_payloads.run(df, units_map, cats_map, tax_id, stock_id)
+    plan_id = _plan_id(records)
+    if store.outstanding() and store.get_meta('plan') == plan_id:
+        print(f"Resuming {store.outstanding()} unfinished shard(s) from {store_path}")
+    else:
+        if store.outstanding():
+            print(f"Dropping {store.outstanding()} unfinished shard(s) planned for a different input")
+        processed = journal.processed_indices if journal is not None else set()
+        records = _gate(records, store, remote_index, skip_duplicates, counts, processed)
+        shards = plan(records, shard_size)
+        store.reset()
+        store.add_shards(shards)
+        store.set_meta('plan', plan_id)
+        print(f"Planned {len(records)} products into {len(shards)} shard(s)")
+
+    processes = max(1, int(processes))
+    store.set_meta('settings', {
+        'api_base': api_base,
+        'workers': workers,
+        'requests_per_second': requests_per_second / processes,
+        'http_timeout': http_timeout,
+        'max_retries': max_retries,
+        'lease_seconds': lease_seconds,
+        'skip_duplicates': skip_duplicates,
+        'resend_changed': resend_changed,
+        'dead_letter_file': dead_letter_file,
+    })
+
+    log_dir = os.path.dirname(os.path.abspath(store_path))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(work, store_path, headers, log_path=os.path.join(log_dir, f"upload_worker_{i}.log"))
+                   for i in range(1, processes + 1)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Upload worker crashed: {e}")
+
+    for name, value in store.totals().items():
+        counts[name] = counts.get(name, 0) + value
+    left = store.outstanding()
+    if journal is not None:
+        journal.merge(store.synced(), store.type1_ids())
+        journal.close()
+    store.close()
+
+    print(f"\n{'='*50}")
+    print(f"Processing Complete ....")
+    print(f"Success: {counts.get('success', 0)}")
+    print(f"Failed: {counts.get('failed', 0)}")
+    for name in ('duplicates', 'skipped', 'unchanged', 'changed'):
+        if counts.get(name):
+            print(f"{name.capitalize()}: {counts[name]}")
+    if left:
+        print(f"Unfinished shards: {left} (run again to resume)")
+    print(f"{'='*50}")
+    return counts
+
+
+def plan(records, shard_size=500):
+    # Groups rows by normalized name in first-seen order and packs whole
+    # groups into shards of roughly shard_size rows. A group is never split.
+    groups = {}
+    for record in records:
+        groups.setdefault(record.get('group') or normalize_name(record['name']), []).append(record)
+
+    shards, current = [], []
+    for group in groups.values():
+        if current and len(current) + len(group) > shard_size:
+            shards.append(current)
+            current = []
+        current.extend(group)
+    if current:
+        shards.append(current)
+    return shards
+
+
+def work(store_path, headers, owner=None, log_path=None):
+    # Worker loop: claim a shard, upload it with send_products while a
+    # heartbeat keeps its lease alive, mark it done, repeat. Shards leased by
+    # other workers are waited on, so a dead worker's shard is picked up once
+    # its lease expires.
+    owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    log = open(log_path, 'a', encoding='utf-8') if log_path else None
+    with contextlib.ExitStack() as stack:
+        if log:
+            stack.enter_context(log)
+            stack.enter_context(contextlib.redirect_stdout(log))
+        store = ShardStore(store_path)
+        stack.callback(store.close)
+        settings = store.get_meta('settings')
+        if not settings:
+            print(f"{store_path} has no upload plan")
+            return 0
+        lease_seconds = settings['lease_seconds']
+        client = ApiClient(
+            {k: v for k, v in headers.items() if k != 'Content-Type'},
+            timeout=settings['http_timeout'],
+            max_retries=settings['max_retries'],
+            pool_size=max(settings['workers'], 10),
+            rate_limiter=RateLimiter(rate=settings['requests_per_second'])
+        )
+        stack.callback(client.close)
+
+        done = 0
+        while True:
+            claim = store.claim(owner, lease_seconds)
+            if claim is None:
+                if not store.outstanding():
+                    break
+                time.sleep(min(lease_seconds / 4, 1))
+                continue
+
+            shard_id, records = claim
+            print(f"\n[{owner}] Shard {shard_id}: {len(records)} products")
+            stop = threading.Event()
+            lost = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat,
+                                         args=(store, shard_id, owner, lease_seconds, stop, lost), daemon=True)
+            heartbeat.start()
+            try:
+                counts = send_products.run(
+                    products_file=None, units_mapping=None, categories_mapping=None, cache_file=None,
+                    token=None, api_base=settings['api_base'], headers=headers, tax_id=None, stock_id=None,
+                    workers=settings['workers'], client=client, records=records,
+                    journal=ShardJournal(store), skip_duplicates=settings['skip_duplicates'],
+                    resend_changed=settings['resend_changed'],
+                    dead_letter_file=settings.get('dead_letter_file'),
+                    cancel=lost
+                )
+            finally:
+                stop.set()
+                heartbeat.join()
+            if lost.is_set():
+                # Another worker owns the shard now and sends the rest.
+                continue
+            store.complete(shard_id, owner, counts)
+            done += 1
+    return done
+
+
+def _heartbeat(store, shard_id, owner, lease_seconds, stop, lost):
+    while not stop.wait(lease_seconds / 3):
+        if not store.renew(shard_id, owner, lease_seconds):
+            print(f"[{owner}] Lost the lease on shard {shard_id}; not sending the rest of it")
+            lost.set()
+            return
+
+
+def _plan_id(records):
+    digest = hashlib.sha1()
+    for record in records:
+        digest.update(f"{record['index']}|{record.get('key')}|{record.get('fingerprint')}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _seed(store, journal):
+    # Keys, Type 1 ids and in-flight creates from regular runs, so neither the
+    # gate nor the workers post them again.
+    synced, names = store.synced(), store.type1_ids()
+    store.record_many(
+        [(key, fingerprint, None, None) for key, fingerprint in journal.synced.items() if key not in synced]
+        + [(None, None, name, product_id) for name, product_id in journal.type1_ids.items() if name not in names]
+    )
+    for key, index in journal.inflight.items():
+        if key not in synced:
+            store.mark_inflight(key, index)
+
+
+def _gate(records, store, remote_index, skip_duplicates, counts, processed=()):
+    # The whole-file checks send_products does per run, done once here so
+    # they also hold across shards.
+    remote_barcodes = (remote_index or {}).get('barcodes', {})
+    remote_names = (remote_index or {}).get('type1_names', {})
+    known_names = store.type1_ids()
+    entries = [(None, None, name, remote_id) for name, remote_id in remote_names.items()
+               if name not in known_names]
+    remote_names = {normalize_name(name): remote_id for name, remote_id in remote_names.items()}
+
+    synced = store.synced()
+    kept, seen = [], set()
+    for record in records:
+        if record['key'] not in synced and record['index'] in processed:
+            # Row-index checkpoint of an older regular run.
+            continue
+        barcode = record['barcode']
+        if barcode and barcode in seen and skip_duplicates:
+            counts['duplicates'] += 1
+            continue
+        if barcode:
+            seen.add(barcode)
+
+        remote_id = remote_barcodes.get(barcode) if barcode else None
+        if remote_id is None and not barcode and record['product_type'] == 1:
+            remote_id = remote_names.get(record['group'])
+        if remote_id is not None:
+            entries.append((record['key'], record['fingerprint'],
+                            record['name'] if record['product_type'] == 1 else None, remote_id))
+            counts['skipped'] += 1
+            continue
+        kept.append(record)
+    store.record_many(entries)
+    return kept
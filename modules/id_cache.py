@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from .sqlite_util import Transaction
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ids (
+    tenant TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    name TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (tenant, entity, name)
+);
+CREATE TABLE IF NOT EXISTS generations (
+    tenant TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    PRIMARY KEY (tenant, entity)
+);
+"""
+
+# SQLite's default limit on bound parameters is 999.
+CHUNK = 500
+
+
+class IdCache:
+    # Shared name -> id store for units and categories, keyed by tenant and
+    # entity. One file can serve every client and every run; parallel
+    # pipelines open it from their own threads or processes (WAL mode).
+    # An entry is stale once it is older than ttl seconds or was written
+    # before the last invalidate() of its tenant and entity.
+
+    def __init__(self, path, tenant, ttl=None, timeout=30):
+        self.path = path
+        self.tenant = tenant
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, entity, names):
+        # Returns {name: id} for the names with a fresh entry.
+        names = list(dict.fromkeys(names))
+        oldest = time.time() - self.ttl if self.ttl else 0
+        found = {}
+        with self._lock:
+            generation = self._generation(entity)
+            for start in range(0, len(names), CHUNK):
+                chunk = names[start:start + CHUNK]
+                marks = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT name, id FROM ids WHERE tenant = ? AND entity = ? AND generation = ? "
+                    f"AND updated_at >= ? AND name IN ({marks})",
+                    (self.tenant, entity, generation, oldest, *chunk)
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, entity, mapping):
+        now = time.time()
+        with self._lock, self._transaction():
+            generation = self._generation(entity)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ids (tenant, entity, name, id, generation, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.tenant, entity, name, int(value), generation, now) for name, value in mapping.items()]
+            )
+
+    def forget(self, entity, names):
+        with self._lock, self._transaction():
+            self._conn.executemany(
+                "DELETE FROM ids WHERE tenant = ? AND entity = ? AND name = ?",
+                [(self.tenant, entity, name) for name in names]
+            )
+
+    def invalidate(self, entity=None):
+        # Bumps the generation so every existing entry of this tenant (and
+        # entity, if given) is ignored; old rows are removed as well.
+        entities = [entity] if entity else ['unit', 'category']
+        with self._lock, self._transaction():
+            for name in entities:
+                self._conn.execute(
+                    "INSERT INTO generations (tenant, entity, generation) VALUES (?, ?, 1) "
+                    "ON CONFLICT (tenant, entity) DO UPDATE SET generation = generation + 1",
+                    (self.tenant, name)
+                )
+                self._conn.execute("DELETE FROM ids WHERE tenant = ? AND entity = ?", (self.tenant, name))
+
+    def _generation(self, entity):
+        row = self._conn.execute(
+            "SELECT generation FROM generations WHERE tenant = ? AND entity = ?", (self.tenant, entity)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _transaction(self):
+        return Transaction(self._conn)
+
+
+def tenant_of(token, api_base=''):
+    # IDs belong to the account behind the token, so the tenant is the API
+    # host plus the token's JWT subject. Tokens that are not JWTs fall back
+    # to a hash, which still keeps different clients apart.
+    host = urlparse(api_base).netloc
+    subject = None
+    parts = token.split('.')
+    if len(parts) == 3:
+        try:
+            claims = json.loads(base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)))
+            subject = claims.get('sub')
+        except (ValueError, AttributeError):
+            subject = None
+    if subject is None:
+        subject = hashlib.sha256(token.encode('utf-8')).hexdigest()[:12]
+    return f"{host}/{subject}"
+
+
+def open_cache(config, api_base=''):
+    # None when the cache is turned off (id_cache set to None or '').
+    path = config.get('id_cache')
+    if not path:
+        return None
+    try:
+        return IdCache(str(path), tenant_of(config['token'], api_base), ttl=config.get('id_cache_ttl'))
+    except sqlite3.Error as e:
+        print(f"Could not open ID cache {path} ({e}), continuing without it")
+        return None
@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import build_payloads, reconcile_products, send_products
+
+
+FORMAT = "fatoorah-payloads"
+VERSION = 2
+PER_STOCK_FIELDS = ("stock_id", "tax[0][id]")
+
+
+def compile_payloads(df, units_mapping, categories_mapping, path, tenant=None):
+    # Builds every payload once and writes them as JSON Lines (gzip when the
+    # path ends in .gz) without the per-stock fields, which are filled in at
+    # upload time. The first line is a header naming the account (tenant)
+    # whose unit and category ids the payloads carry.
+    with open(units_mapping, 'r', encoding='utf-8') as f:
+        units_map = json.load(f)
+    with open(categories_mapping, 'r', encoding='utf-8') as f:
+        cats_map = json.load(f)
+
+    records = build_payloads.run(df, units_map, cats_map, tax_id="", stock_id="")
+    unit_names = _names(df, 'unit')
+    cat_names = _names(df, 'category')
+    header = {"format": FORMAT, "version": VERSION, "rows": len(records), "tenant": tenant,
+              "per_stock_fields": list(PER_STOCK_FIELDS)}
+    tmp_path = f"{path}.tmp"
+    with _open(tmp_path, 'wt', compressed=str(path).endswith('.gz')) as f:
+        f.write(json.dumps(header) + "\n")
+        for record in records:
+            record.pop('fingerprint', None)
+            record['unit_name'] = unit_names[record['index']]
+            record['category_name'] = cat_names[record['index']]
+            for field in PER_STOCK_FIELDS:
+                record['payload'].pop(field, None)
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    os.replace(tmp_path, path)
+    print(f"Compiled {len(records)} payloads to {path}")
+    return len(records)
+
+
+def read_header(path):
+    with _open(path, 'rt') as f:
+        header = json.loads(f.readline())
+    if header.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a compiled payload artifact")
+    if header.get("version") not in (1, VERSION):
+        raise ValueError(f"{path} has unsupported artifact version {header.get('version')}")
+    return header
+
+
+def iter_destination_batches(path, stock_id, tax_id, batch_size=1000, resolve=None):
+    # Streams the artifact with this destination's fields filled in.
+    # resolve(records), given for a destination in another account, swaps
+    # in that account's unit and category ids. The fingerprint is computed
+    # here so it matches a regular run for the stock.
+    read_header(path)
+    batch = []
+    with _open(path, 'rt') as f:
+        f.readline()
+        for line in f:
+            if not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield _fill(batch, stock_id, tax_id, resolve)
+                batch = []
+    if batch:
+        yield _fill(batch, stock_id, tax_id, resolve)
+
+
+def fan_out(path, destinations, api_base, workers=4, batch_size=1000, skip_duplicates=True,
+            resend_changed=False, reconcile=True, same_account='upload'):
+    # Uploads one artifact to several destinations at the same time. Each
+    # destination is a dict with stock_id, tax_id, tenant, headers, client,
+    # cache_file and dead_letter_file, plus resolve when its account is not
+    # the one the artifact was compiled for. Destinations of one account
+    # share its client (and request budget). Whether a barcode may exist once
+    # per stock or once per account is up to the API: with several stocks of
+    # one account, same_account='upload' sends every stock and rows the API
+    # turns down end up in that stock's dead-letter file as duplicate
+    # barcodes; 'skip' sends only the first stock of each account and
+    # reports the others' rows as skipped.
+    header = read_header(path)
+    print(f"Fanning out {header['rows']} payloads to {len(destinations)} destination(s)...")
+
+    first_stock = {}
+    for destination in destinations:
+        first_stock.setdefault(destination['tenant'], destination['stock_id'])
+    for tenant, stock_id in first_stock.items():
+        others = [d['stock_id'] for d in destinations if d['tenant'] == tenant and d['stock_id'] != stock_id]
+        if others:
+            action = ("skipped" if same_account == 'skip' else
+                      "uploaded too; barcodes the API refuses there are listed in their failed_products files")
+            print(f"  Stocks {', '.join(others)} share an account with stock {stock_id}: {action}")
+
+    def upload(destination):
+        stock_id, tax_id = str(destination['stock_id']), str(destination['tax_id'])
+        if same_account == 'skip' and first_stock[destination['tenant']] != destination['stock_id']:
+            return {'success': 0, 'failed': 0, 'skipped': header['rows']}
+        print(f"\n[stock {stock_id}] Uploading to stock {stock_id} (tax {tax_id})")
+        remote_index = None
+        if reconcile:
+            remote_index = reconcile_products.run(api_base, destination['headers'], client=destination['client'],
+                                                  stock_id=stock_id)
+        return send_products.run(
+            products_file=path, units_mapping=None, categories_mapping=None,
+            cache_file=destination['cache_file'],
+            token=None, api_base=api_base, headers=destination['headers'], tax_id=tax_id, stock_id=stock_id,
+            workers=workers, client=destination['client'],
+            batches=iter_destination_batches(path, stock_id, tax_id, batch_size, destination.get('resolve')),
+            remote_index=remote_index,
+            dead_letter_file=destination['dead_letter_file'],
+            skip_duplicates=skip_duplicates,
+            resend_changed=resend_changed
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, len(destinations))) as pool:
+        results = [counts or {} for counts in pool.map(upload, destinations)]
+
+    print(f"\n{'='*50}")
+    print("Fan-out complete")
+    for destination, counts in zip(destinations, results):
+        print(f"  stock {destination['stock_id']}: success {counts.get('success', 0)}, "
+              f"failed {counts.get('failed', 0)}, duplicates {counts.get('duplicates', 0)}, "
+              f"skipped {counts.get('skipped', 0)}, unchanged {counts.get('unchanged', 0)}")
+    print(f"{'='*50}")
+    return results
+
+
+def parse_destinations(text):
+    # "1:5,2:5,7:5:BRANCH_TOKEN" -> stock_id:tax_id pairs, optionally with the
+    # name of an environment variable holding that destination's token.
+    destinations = []
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        fields = part.strip().split(':')
+        if len(fields) not in (2, 3) or not all(fields):
+            raise ValueError(f"Destination {part!r} must look like stock_id:tax_id or stock_id:tax_id:TOKEN_ENV")
+        destination = {"stock_id": fields[0], "tax_id": fields[1]}
+        if len(fields) == 3:
+            destination["token"] = os.environ.get(fields[2])
+            if not destination["token"]:
+                raise ValueError(f"Environment variable {fields[2]} for destination {part!r} is not set")
+        destinations.append(destination)
+    return destinations
+
+
+def apply_ids(records, units_map, cats_map):
+    # Swaps in another account's unit and category ids, looked up by the
+    # names the artifact carries; unknown names get the defaults.
+    units_map = {str(k).strip(): v for k, v in units_map.items()}
+    cats_map = {str(k).strip(): v for k, v in cats_map.items()}
+    for record in records:
+        payload = record['payload']
+        payload['unit_id'] = str(units_map.get(record.get('unit_name') or '', build_payloads.DEFAULT_UNIT_ID))
+        payload['main_cat_id'] = str(cats_map.get(record.get('category_name') or '',
+                                                  build_payloads.DEFAULT_CATEGORY_ID))
+
+
+def destination_suffix(stock_id, tenant=None):
+    # File suffix for a destination's checkpoint and dead-letter file; the
+    # account is added for destinations in another account.
+    if tenant is None:
+        return f"stock_{stock_id}"
+    return f"stock_{stock_id}_{account_suffix(tenant)}"
+
+
+def account_suffix(tenant):
+    return hashlib.sha1(tenant.encode('utf-8')).hexdigest()[:8]
+
+
+def _fill(batch, stock_id, tax_id, resolve):
+    if resolve:
+        resolve(batch)
+    for record in batch:
+        payload = record['payload']
+        payload["stock_id"] = str(stock_id)
+        payload["tax[0][id]"] = str(tax_id)
+        record['fingerprint'] = build_payloads.fingerprint(payload, record['conversion_rate'])
+    return batch
+
+
+def _names(df, column):
+    if column not in df.columns:
+        return {index: '' for index in df.index}
+    return df[column].astype(str).str.strip().where(df[column].notna(), '').to_dict()
+
+
+def _open(path, mode, compressed=None):
+    if compressed is None:
+        compressed = str(path).endswith('.gz')
+    if compressed:
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode.replace('t', ''), encoding='utf-8')
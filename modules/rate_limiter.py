@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class RateLimiter:
+    # Token bucket shared by every stage of a run. The refill rate is adaptive:
+    # it is halved on 429s, timeouts or when recent latency climbs well above
+    # the long-run baseline, then ramps back additively towards the ceiling
+    # while responses stay healthy.
+
+    def __init__(self, rate=10.0, burst=None, min_rate=0.5, decrease_factor=0.5,
+                 recovery=None, latency_factor=2.0, cooldown=1.0, warmup=20):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self.decrease_factor = decrease_factor
+        self.recovery = recovery or self.max_rate * 0.1
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.warmup = warmup
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._samples = 0
+        self._fast_latency = None
+        self._slow_latency = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def record(self, status, latency):
+        with self._lock:
+            if status is None or status == 429:
+                self._decrease()
+                return
+
+            self._samples += 1
+            if self._fast_latency is None:
+                self._fast_latency = self._slow_latency = latency
+            else:
+                self._fast_latency += 0.2 * (latency - self._fast_latency)
+                self._slow_latency += 0.02 * (latency - self._slow_latency)
+
+            if self._samples > self.warmup and self._fast_latency > self.latency_factor * self._slow_latency:
+                self._decrease()
+            elif status < 500:
+                self.rate = min(self.max_rate, self.rate + self.recovery / self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._tokens = min(self._tokens, 0.0)
+        print(f"  -> Throttling detected, rate limit lowered to {self.rate:.1f} req/s")
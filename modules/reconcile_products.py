@@ -0,0 +1,88 @@
+from .api_client import ApiClient
+from .rate_limiter import RateLimiter
+
+
+BARCODE_FIELDS = ('defaultParCode', 'default_par_code', 'par_code', 'bar_code', 'barcode')
+# Compared, when the listing returns them, before a product without a
+# barcode is taken for a row: Type 5 siblings share name, type and unit.
+MATCH_FIELDS = ('salePrice', 'complex_products[0][quantity]', 'complex_products[0][unique_id]')
+
+
+def run(api_base, headers, client=None, per_page=100, stock_id=None):
+   
+    client = client or ApiClient(headers, rate_limiter=RateLimiter(rate=2))
+
+    print("Fetching existing products...")
+    try:
+        items = client.fetch_all(f"{api_base}/all", per_page=per_page)
+    except Exception as e:
+        print(f"Error fetching products: {e}")
+        return None
+
+    # With a stock_id, products the listing places in another stock are left
+    # out, so uploading into a new stock does not skip them. Items without a
+    # stock_id (Type 5 creates carry none) always count.
+    barcodes = {}
+    type1_names = {}
+    for item in items:
+        if stock_id is not None and str(item.get('stock_id') or stock_id) != str(stock_id):
+            continue
+        barcode = _barcode(item)
+        if barcode:
+            barcodes.setdefault(barcode, item['id'])
+        if str(item.get('product_type', '')).strip() == '1':
+            name = str(item.get('name', '')).strip()
+            if name:
+                type1_names.setdefault(name, item['id'])
+
+    print(f"Remote products: {len(items)}, with barcode: {len(barcodes)}, Type 1 names: {len(type1_names)}")
+    return {'barcodes': barcodes, 'type1_names': type1_names}
+
+
+def find_product(client, api_base, barcode='', name='', product_type=None, unit_id=None, payload=None,
+                 exclude=()):
+    # Looks one product up in the remote listing: by barcode when it has one,
+    # otherwise by exact name, type and unit plus the MATCH_FIELDS of
+    # payload. Ids in exclude are never returned. Returns its id or None.
+    keywords = [barcode, name] if barcode else [name]
+    for keyword in keywords:
+        if not keyword:
+            continue
+        resp = client.get(f"{api_base}/all", params={'keyword': keyword, 'page': 1, 'per_page': 50, 'limit': 50})
+        resp.raise_for_status()
+        body = resp.json().get('data') or {}
+        items = body if isinstance(body, list) else body.get('data') or []
+        for item in items:
+            if barcode:
+                if _barcode(item) == barcode:
+                    return item['id']
+                continue
+            if str(item.get('name', '')).strip() != name:
+                continue
+            # A listing without the type or unit cannot prove the match.
+            if product_type is not None and str(item.get('product_type', '')).strip() != str(product_type):
+                continue
+            if unit_id is not None and str(item.get('unit_id', '')).strip() != str(unit_id):
+                continue
+            if item['id'] in exclude:
+                continue
+            if payload and not all(_same(item[field], payload[field]) for field in MATCH_FIELDS
+                                   if field in item and field in payload):
+                continue
+            return item['id']
+    return None
+
+
+def _same(remote, local):
+    try:
+        return float(remote) == float(local)
+    except (TypeError, ValueError):
+        return str(remote).strip() == str(local).strip()
+
+
+def _barcode(item):
+    for field in BARCODE_FIELDS:
+        value = item.get(field)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
@@ -1,20 +1,41 @@
-import pandas as pd
-import requests
 import json
-import time
+import os
+import threading
 
+from . import build_payloads, reconcile_products
+from .telemetry import Progress
+from .api_client import ApiClient, LookupFailed
+from .data_loader import load_products
+from . import dead_letter
+from .dead_letter import DeadLetterQueue
+from .rate_limiter import RateLimiter
+from .shard_store import ShardJournal, ShardStore
+from .sort_products import GroupIndex, normalize_name
+from .upload_journal import UploadJournal
+from .upload_scheduler import UploadScheduler
 
-def run(products_file, units_mapping, categories_mapping, cache_file, token, api_base, headers,tax_id,stock_id):
+
+DUPLICATE_MARKERS = ("default par code", "taken", "بالفعل")
+
+
+def run(products_file, units_mapping, categories_mapping, cache_file, token, api_base, headers, tax_id, stock_id, workers=1, client=None, df=None, batches=None,
+        remote_index=None, records=None, payloads_file=None, skip_duplicates=True, resend_changed=False, journal=None,
+        dead_letter_file=None, group_index=None, cancel=None):
    
     try:
         print("Loading data...")
-        df = pd.read_excel(products_file)
+        if df is None and batches is None and records is None:
+            df = load_products(products_file)
+            
+        # Prebuilt records (or batches of them, without mapping files)
+        # already carry their unit and category ids.
+        units_map, cats_map = {}, {}
+        if records is None and units_mapping is not None:
+            with open(units_mapping, 'r', encoding='utf-8') as f:
+                units_map = json.load(f)
             
-        with open(units_mapping, 'r', encoding='utf-8') as f:
-            units_map = json.load(f)
-        
-        with open(categories_mapping, 'r', encoding='utf-8') as f:
-            cats_map = json.load(f)
+            with open(categories_mapping, 'r', encoding='utf-8') as f:
+                cats_map = json.load(f)
             
     except Exception as e:
         print(f"Error loading files: {e}")
@@ -23,137 +44,372 @@ def run(products_file, units_mapping, categories_mapping, cache_file, token, api
     units_map = {k.strip(): v for k, v in units_map.items()}
     cats_map = {k.strip(): v for k, v in cats_map.items()}
     
-    try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            checkpoint = json.load(f)
-            type1_cache = checkpoint.get("type1_ids", {})
-            processed_indices = set(checkpoint.get("processed_indices", []))
-            print(f"Resuming... {len(processed_indices)} items already processed.")
-    except FileNotFoundError:
-        type1_cache = {}
-        processed_indices = set()
+    if journal is None:
+        journal = UploadJournal(cache_file)
+    # Type 5 rows are linked through the normalized-name group index, so case
+    # and spacing variants of a name resolve to the same Type 1 base. Ids
+    # from earlier runs (keyed by raw name) are normalized on load.
+    links = group_index if group_index is not None else GroupIndex()
+    links.seed(journal.type1_ids)
+    synced = journal.synced
+    processed_indices = journal.processed_indices
+    if synced:
+        print(f"Incremental sync... {len(synced)} products already synced.")
+    if processed_indices:
+        print(f"Resuming... {len(processed_indices)} items already processed (row-index checkpoint).")
+    if not synced and not processed_indices:
         print("Starting fresh upload...")
 
-    used_barcodes = set()
-    success_count = 0
-    fail_count = 0
-    
-    print(f"Processing {len(df)} products...")
-    
-    for index, row in df.iterrows():
-        if index in processed_indices:
-            continue
-            
+    lock = threading.Lock()
+    counts = {'success': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0, 'unchanged': 0, 'changed': 0,
+              'adopted': 0}
+
+    if client is None:
+        client = ApiClient(
+            {k: v for k, v in headers.items() if k != 'Content-Type'},
+            pool_size=max(workers, 10),
+            rate_limiter=RateLimiter(rate=10)
+        )
+
+    progress = Progress('products')
+    dead_letters = DeadLetterQueue(dead_letter_file, getattr(journal, 'checkpoint', None)) if dead_letter_file else None
+
+    # Keys this run marked in flight. A failure clears its marker only when
+    # the create is known not to exist: the API answered, or the lookup after
+    # the last attempt completed without finding it.
+    marked = set()
+
+    def record_failure(record, reason, message='', resp=None, settled=True):
+        key = record.get('key')
+        if key in marked and settled:
+            journal.clear_inflight(key)
+        marked.discard(key)
+        if dead_letters:
+            dead_letters.add(record, reason, message, resp)
+        with lock:
+            counts['failed'] += 1
+        progress.update()
+
+    def rejected(record, resp):
+        print(f"  -> Failed: {resp.text[:200]}")
+        record_failure(record, 'http_error' if resp.status_code != 200 else 'rejected', resp=resp)
+
+    # Product ids created or adopted by this run, so a lookup never adopts
+    # the same product for two rows.
+    claimed = set()
+
+    def record_success(record, name=None, new_id=None):
+        journal.record(record['index'], name, new_id, record.get('key'), record.get('fingerprint'))
+        with lock:
+            counts['success'] += 1
+            if new_id is not None:
+                claimed.add(new_id)
+        progress.update()
+
+    inflight_at_start = set(journal.inflight)
+    if inflight_at_start:
+        print(f"{len(inflight_at_start)} product(s) were in flight when the last run stopped; they are verified first.")
+
+    def lookup(record, payload):
+        with lock:
+            exclude = set(claimed)
+        return reconcile_products.find_product(
+            client, api_base, record['barcode'], record['name'], record['product_type'],
+            payload.get('unit_id'), payload=payload, exclude=exclude
+        )
+
+    def is_duplicate(resp):
+        if resp.status_code != 200 or resp.json().get('status') != 0:
+            return False
+        return any(marker in resp.json().get('message', '') for marker in DUPLICATE_MARKERS)
+
+    def post(record, payload):
+        # Returns (resp, duplicate, existing_id). The create is written ahead
+        # as in flight and sent through client.create, which looks it up
+        # instead of blindly retrying; rows left in flight by an earlier run
+        # are looked up before the first attempt.
+        key = record.get('key')
+        if key is not None:
+            journal.mark_inflight(key, record['index'])
+            marked.add(key)
+        resp, existing_id = client.create(
+            f"{api_base}/create", lambda: lookup(record, payload), is_duplicate=is_duplicate,
+            resumed=key is not None and key in inflight_at_start, data=payload
+        )
+        if existing_id:
+            return None, False, existing_id
+        if is_duplicate(resp):
+            print(f"  -> Duplicate Barcode")
+            return resp, True, None
+        return resp, False, None
+
+    def adopt(record, existing_id, name=None):
+        print(f"  -> Already created by an earlier attempt, adopted ID: {existing_id}")
+        with lock:
+            counts['adopted'] += 1
+        record_success(record, name, existing_id)
+
+    def group_of(record):
+        return record.get('group') or normalize_name(record['name'])
+
+    def send(record):
+        index, name, p_type = record['index'], record['name'], record['product_type']
+        # cancel (a threading.Event) drops rows that have not been sent
+        # yet, e.g. once a distributed worker has lost its shard's lease.
+        if cancel is not None and cancel.is_set():
+            return
         try:
-            name = str(row['name']).strip()
-            p_type = int(row['product_type'])
-            
-            unit_name = str(row['unit']).strip()
-            cat_name = str(row['category']).strip()
-            
-            unit_id = units_map.get(unit_name, 14656) 
-            cat_id = cats_map.get(cat_name, 4470)
-            
-            barcode = str(row['bar_code']).strip() if pd.notna(row['bar_code']) else ""
-            
-            req_headers = headers.copy()
-            if 'Content-Type' in req_headers:
-                del req_headers['Content-Type']
-            
-            payload = {
-                "name": name,
-                "buyPrice": str(row['buy_price']) if pd.notna(row['buy_price']) else "0",
-                "salePrice": str(row['sale_price']),
-                "defaultParCode": barcode,
-                "type": "1",
-                "unit_id": str(unit_id),
-                "stock_id": str(stock_id),
-                "first_quantity": str(row['first_quantity']) if pd.notna(row['first_quantity']) else "0",
-                "main_cat_id": str(cat_id),
-                "product_type": str(p_type),
-                "is_active": "1",
-                "is_unique": "0",
-                "standard_barcode_type": "gs1",
-                "tag_id": "1",
-                "status": "1",
-                "is_online": "1",
-                "salePriceWithTax": str(float(row['sale_price']) * 1.15),
-                "price_including_tax": "0",
-                "unifiedBarcodeType": "1212",
-                "tax[0][type]": "main",
-                "tax[0][id]": str(tax_id)
-            }
+            if record.get('error'):
+                print(f"[{index}] Exception: {record['error']}")
+                record_failure(record, 'invalid_row', record['error'])
+                return
+
+            payload = record['payload']
             
             if p_type == 1:
                 print(f"[{index}] Sending Type 1: {name}")
-                resp = requests.post(f"{api_base}/create", headers=req_headers, data=payload)
-                
-                if resp.status_code == 200 and resp.json().get('status') == 0:
-                    msg = resp.json().get('message', '')
-                    if "default par code" in msg or "taken" in msg or "بالفعل" in msg:
-                        print(f"  -> Duplicate Barcode")
-                        fail_count += 1
-                        continue
+                resp, duplicate, existing_id = post(record, payload)
+                if existing_id:
+                    links.set_base_id(group_of(record), existing_id, index)
+                    adopt(record, existing_id, name)
+                    return
+                if duplicate:
+                    record_failure(record, 'duplicate_barcode', "Duplicate barcode", resp)
+                    return
 
                 if resp.status_code == 200 and resp.json().get('status') == 1:
                     new_id = resp.json()['data']['id']
-                    type1_cache[name] = new_id
                     print(f"  -> Success! ID: {new_id}")
-                    success_count += 1
-                    
-                    processed_indices.add(index)
-                    with open(cache_file, 'w', encoding='utf-8') as f:
-                         json.dump({"type1_ids": type1_cache, "processed_indices": list(processed_indices)}, f)
+                    links.set_base_id(group_of(record), new_id, index)
+                    record_success(record, name, new_id)
                 else:
-                    print(f"  -> Failed: {resp.text[:200]}")
-                    fail_count += 1
+                    rejected(record, resp)
                     
             elif p_type == 5:
                 print(f"[{index}] Sending Type 5: {name}")
-                base_id = type1_cache.get(name)
+                base_id = links.base_id(group_of(record))
                 
                 if not base_id:
-                    print(f"  -> Error: Base product (Type 1) not found in cache.")
-                    fail_count += 1
-                    continue
-                    
-                conv_rate = row['Conversion_rate'] if pd.notna(row['Conversion_rate']) else 1
+                    message = "Base product (Type 1) not found in cache"
+                    if group_index is not None and not links.has_base_row(group_of(record)):
+                        message += " (no Type 1 row with this name in the file)"
+                    print(f"  -> Error: {message}.")
+                    record_failure(record, 'missing_base', message)
+                    return
                 
-                payload["complex_products[0][quantity]"] = str(conv_rate)
+                payload = dict(payload)
+                payload["complex_products[0][quantity]"] = record['conversion_rate']
                 payload["complex_products[0][unique_id]"] = str(base_id)
                 payload["complex_products[0][discount]"] = "0"
                 
-                resp = requests.post(f"{api_base}/create", headers=req_headers, data=payload)
-
-                if resp.status_code == 200 and resp.json().get('status') == 0:
-                    msg = resp.json().get('message', '')
-                    if "default par code" in msg or "taken" in msg or "بالفعل" in msg:
-                        print(f"  -> Duplicate Barcode")
-                        fail_count += 1
-                        continue
+                resp, duplicate, existing_id = post(record, payload)
+                if existing_id:
+                    adopt(record, existing_id)
+                    return
+                if duplicate:
+                    record_failure(record, 'duplicate_barcode', "Duplicate barcode", resp)
+                    return
                 
                 if resp.status_code == 200 and resp.json().get('status') == 1:
                     new_id = resp.json()['data']['id']
                     print(f"  -> Success! ID: {new_id} (Linked to {base_id})")
-                    success_count += 1
-                    
-                    processed_indices.add(index)
-                    with open(cache_file, 'w', encoding='utf-8') as f:
-                         json.dump({"type1_ids": type1_cache, "processed_indices": list(processed_indices)}, f)
+                    record_success(record, new_id=new_id)
                 else:
-                    print(f"  -> Failed: {resp.text[:200]}")
-                    fail_count += 1
-            
-            time.sleep(0.1)
+                    rejected(record, resp)
             
+        except LookupFailed as e:
+            # The product may exist remotely; it stays in flight so the next
+            # run or --retry-failed looks it up before posting again.
+            print(f"[{index}] Exception: {e}")
+            record_failure(record, 'exception', str(e), settled=False)
         except Exception as e:
             print(f"[{index}] Exception: {e}")
-            fail_count += 1
+            record_failure(record, 'exception', str(e))
+
+    remote_barcodes = {}
+    remote_names = {}
+    if remote_index:
+        remote_barcodes = remote_index.get('barcodes', {})
+        remote_names = {normalize_name(name): remote_id
+                        for name, remote_id in remote_index.get('type1_names', {}).items()}
+        seeded = links.seed(remote_index.get('type1_names', {}))
+        print(f"Seeded {seeded} Type 1 IDs from remote products")
+
+    def already_remote(record):
+        barcode, name, p_type = record['barcode'], record['name'], record['product_type']
+        remote_id = remote_barcodes.get(barcode) if barcode else None
+        if remote_id is None and not barcode and p_type == 1:
+            remote_id = remote_names.get(group_of(record))
+        if remote_id is None:
+            return False
+        if p_type == 1:
+            links.set_base_id(group_of(record), remote_id, record['index'])
+
+        print(f"[{record['index']}] Already exists remotely: {name} (ID: {remote_id})")
+        journal.record(record['index'], name if p_type == 1 else None, remote_id,
+                       record.get('key'), record.get('fingerprint'))
+        counts['skipped'] += 1
+        return True
+
+    def already_synced(record, quiet=False):
+        # Rows are matched to earlier runs by key, so inserted, removed or
+        # re-sorted rows do not shift anything. A known key with a different
+        # fingerprint means the row was edited since it was uploaded; the API
+        # can only create products, so such rows are reported rather than
+        # resent unless resend_changed is set.
+        key = record.get('key')
+        known = synced.get(key) if key is not None else None
+        if known is None:
+            return record['index'] in processed_indices
+        if quiet:
+            return True
+        if known == record.get('fingerprint'):
+            counts['unchanged'] += 1
+            return True
+        counts['changed'] += 1
+        if resend_changed:
+            print(f"[{record['index']}] Changed since last sync, resending: {record['name']}")
+            return False
+        print(f"[{record['index']}] Changed since last sync, not resent: {record['name']}")
+        return True
+
+    seen_barcodes = set()
+
+    def duplicate_in_file(record):
+        # Only the first row carrying a barcode can ever be created, so later
+        # rows with the same barcode are reported here instead of costing a
+        # rejected request each.
+        barcode = record['barcode']
+        if not barcode:
+            return False
+        if barcode not in seen_barcodes:
+            seen_barcodes.add(barcode)
+            return False
+        if not skip_duplicates:
+            print(f"[{record['index']}] Warning: barcode {barcode} already used earlier in this file")
+            return False
+        if not already_synced(record, quiet=True):
+            print(f"[{record['index']}] Duplicate barcode in file, skipped: {record['name']} ({barcode})")
+            counts['duplicates'] += 1
+        return True
+
+    scheduler = UploadScheduler(
+        send,
+        group_of=group_of,
+        is_base=lambda record: record['product_type'] == 1,
+        is_ready=lambda record: group_of(record) in links,
+        workers=workers
+    )
+
+    if records is not None:
+        print(f"Processing {len(records)} products with {scheduler.workers} worker(s)...")
+        batches = [records]
+    elif batches is None:
+        print(f"Processing {len(df)} products with {scheduler.workers} worker(s)...")
+        batches = [df]
+    else:
+        print(f"Streaming products with {scheduler.workers} worker(s)...")
+
+    payloads_out = open(payloads_file, 'w', encoding='utf-8') if payloads_file else None
+    
+    for batch in batches:
+        if cancel is not None and cancel.is_set():
+            print("Upload cancelled; remaining products were not sent")
+            break
+        if not isinstance(batch, list):
+            batch = build_payloads.run(batch, units_map, cats_map, tax_id, stock_id)
+        if payloads_out:
+            build_payloads.write_payloads(batch, payloads_out)
+        pending = []
+        for record in batch:
+            if duplicate_in_file(record):
+                continue
+            if already_synced(record) or already_remote(record):
+                continue
+            pending.append(record)
+        progress.add(len(pending))
+        for record in pending:
+            scheduler.submit(record)
+
+    scheduler.join()
+    journal.close()
+    if dead_letters:
+        dead_letters.close()
+    if payloads_out:
+        payloads_out.close()
             
     print(f"\n{'='*50}")
     print(f"Processing Complete ....")
-    print(f"Success: {success_count}")
-    print(f"Failed: {fail_count}")
+    print(f"Success: {counts['success']}")
+    print(f"Failed: {counts['failed']}")
+    if counts['duplicates']:
+        print(f"Duplicate barcodes skipped: {counts['duplicates']}")
+    if counts['skipped']:
+        print(f"Skipped (already exist): {counts['skipped']}")
+    if counts['adopted']:
+        print(f"Adopted after a lost response (included in success): {counts['adopted']}")
+    if counts['unchanged']:
+        print(f"Unchanged since last sync: {counts['unchanged']}")
+    if counts['changed']:
+        print(f"Changed since last sync{'' if resend_changed else ' (not resent)'}: {counts['changed']}")
     print(f"{'='*50}")
     
-    return True
+    return dict(counts)
+
+
+def retry_failed(dead_letter_file, cache_file, api_base, headers, workers=1, client=None, include_permanent=False):
+    # Replays only the products in the dead-letter file: transient failures
+    # first, permanent ones (duplicate barcodes, invalid rows, API rejections)
+    # only with include_permanent. Entries that are not replayed stay in the
+    # file, and replayed rows that fail again are appended back to it. Each
+    # entry is replayed against the checkpoint its run used (regular,
+    # streaming or distributed); entries from before that was recorded use
+    # cache_file.
+    entries = dead_letter.load(dead_letter_file)
+    if not entries:
+        print(f"No failed products in {dead_letter_file}")
+        return {'success': 0, 'failed': 0}
+
+    print(f"Failed products: {len(entries)}")
+    for label, count in sorted(dead_letter.summarize(entries).items()):
+        print(f"  {label}: {count}")
+
+    replay = dead_letter.replay_order(entries, include_permanent)
+    replayed = {id(entry) for entry in replay}
+    kept = [entry for entry in entries if id(entry) not in replayed]
+
+    backup = f"{dead_letter_file}.bak"
+    os.replace(dead_letter_file, backup)
+    with open(dead_letter_file, 'w', encoding='utf-8') as f:
+        for entry in kept:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    print(f"Retrying {len(replay)} product(s), leaving {len(kept)} for manual fixing (previous file: {backup})")
+    waiting = sum(1 for entry in kept if entry['category'] == dead_letter.TRANSIENT)
+    if waiting:
+        print(f"  {waiting} Type 5 product(s) wait for a base that is left for manual fixing")
+    if not replay:
+        return {'success': 0, 'failed': 0}
+
+    fallback = {'kind': 'journal', 'path': os.path.abspath(cache_file)}
+    groups = {}
+    for entry in replay:
+        checkpoint = entry.get('checkpoint') or fallback
+        groups.setdefault((checkpoint['kind'], checkpoint['path']), []).append(entry)
+
+    counts = {}
+    for (kind, path), records in groups.items():
+        print(f"\nReplaying {len(records)} product(s) against {path}")
+        store = ShardStore(path) if kind == 'shards' else None
+        try:
+            result = run(
+                products_file=None, units_mapping=None, categories_mapping=None, cache_file=path,
+                token=None, api_base=api_base, headers=headers, tax_id=None, stock_id=None,
+                workers=workers, client=client, records=records, dead_letter_file=dead_letter_file,
+                journal=ShardJournal(store) if store else None
+            )
+        finally:
+            if store:
+                store.close()
+        for name, value in (result or {}).items():
+            counts[name] = counts.get(name, 0) + value
+    return counts
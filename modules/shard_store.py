@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .sqlite_util import Transaction
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    records TEXT NOT NULL,
+    counts TEXT
+);
+CREATE TABLE IF NOT EXISTS synced (
+    key TEXT PRIMARY KEY,
+    hash TEXT,
+    product_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS type1_ids (
+    name TEXT PRIMARY KEY,
+    product_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    row_index INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class ShardStore:
+    # SQLite-backed lease store and shared checkpoint for distributed uploads.
+    # Shards move pending -> leased -> done; a leased shard whose lease has
+    # expired (its worker died or stalled) can be claimed by another worker.
+    # Every process opens its own ShardStore on the same file.
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_shards(self, shards):
+        rows = [(len(shard), json.dumps(shard, ensure_ascii=False, default=str)) for shard in shards]
+        with self._lock, self._transaction():
+            self._conn.executemany("INSERT INTO shards (size, records) VALUES (?, ?)", rows)
+
+    def reset(self):
+        with self._lock, self._transaction():
+            self._conn.execute("DELETE FROM shards")
+
+    def claim(self, owner, lease_seconds):
+        # Returns (shard_id, records) or None when nothing is claimable.
+        now = time.time()
+        with self._lock, self._transaction():
+            row = self._conn.execute(
+                "SELECT id, status, records FROM shards "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            shard_id, status, records = row
+            self._conn.execute(
+                "UPDATE shards SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (owner, now + lease_seconds, shard_id)
+            )
+        if status == 'leased':
+            print(f"Reclaimed shard {shard_id} after its lease expired")
+        return shard_id, json.loads(records)
+
+    def renew(self, shard_id, owner, lease_seconds):
+        # False means the lease was lost to another worker.
+        with self._lock, self._transaction():
+            cur = self._conn.execute(
+                "UPDATE shards SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                (time.time() + lease_seconds, shard_id, owner)
+            )
+            return cur.rowcount == 1
+
+    def complete(self, shard_id, owner, counts):
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE shards SET status = 'done', lease_expires = NULL, counts = ? WHERE id = ? AND owner = ?",
+                (json.dumps(counts), shard_id, owner)
+            )
+
+    def outstanding(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM shards WHERE status != 'done'").fetchone()[0]
+
+    def totals(self):
+        totals = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT counts FROM shards WHERE counts IS NOT NULL").fetchall()
+        for (counts,) in rows:
+            for name, value in json.loads(counts).items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def set_meta(self, name, value):
+        with self._lock, self._transaction():
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                               (name, json.dumps(value)))
+
+    def get_meta(self, name, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def record(self, key, fingerprint, name=None, product_id=None):
+        self.record_many([(key, fingerprint, name, product_id)])
+
+    def record_many(self, entries):
+        # entries are (key, fingerprint, type1 name or None, product_id)
+        synced = [(key, fp, pid) for key, fp, _, pid in entries if key is not None]
+        names = [(name, pid) for _, _, name, pid in entries if name is not None]
+        with self._lock, self._transaction():
+            self._conn.executemany("INSERT OR REPLACE INTO synced (key, hash, product_id) VALUES (?, ?, ?)", synced)
+            self._conn.executemany("DELETE FROM inflight WHERE key = ?", [(key,) for key, _, _ in synced])
+            self._conn.executemany("INSERT OR REPLACE INTO type1_ids (name, product_id) VALUES (?, ?)", names)
+
+    def mark_inflight(self, key, index):
+        with self._lock, self._transaction():
+            self._conn.execute("INSERT OR REPLACE INTO inflight (key, row_index) VALUES (?, ?)", (key, index))
+
+    def clear_inflight(self, key):
+        with self._lock, self._transaction():
+            self._conn.execute("DELETE FROM inflight WHERE key = ?", (key,))
+
+    def inflight(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, row_index FROM inflight"))
+
+    def synced(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, hash FROM synced"))
+
+    def type1_ids(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, product_id FROM type1_ids"))
+
+    def _transaction(self):
+        return Transaction(self._conn)
+
+
+class ShardJournal:
+    # UploadJournal-compatible view of the shared checkpoint, so
+    # send_products can record into the ShardStore unchanged.
+
+    def __init__(self, store):
+        self.store = store
+        self.checkpoint = {'kind': 'shards', 'path': os.path.abspath(store.path)}
+        self.type1_ids = store.type1_ids()
+        self.synced = store.synced()
+        self.inflight = store.inflight()
+        self.processed_indices = set()
+
+    def __len__(self):
+        return len(self.synced)
+
+    def record(self, index, name=None, new_id=None, key=None, fingerprint=None):
+        self.store.record(key, fingerprint, name, new_id)
+        if name is not None:
+            self.type1_ids[name] = new_id
+        if key is not None:
+            self.synced[key] = fingerprint
+            self.inflight.pop(key, None)
+
+    def mark_inflight(self, key, index):
+        self.store.mark_inflight(key, index)
+        self.inflight[key] = index
+
+    def clear_inflight(self, key):
+        self.store.clear_inflight(key)
+        self.inflight.pop(key, None)
+
+    def close(self):
+        pass
@@ -1,29 +1,108 @@
+import re
+import threading
+
 import pandas as pd
 
+from .data_loader import load_products, save_products
+
 
-def run(input_file, output_file):
- 
+def run(input_file=None, output_file=None, df=None, reset_index=True):
+    # reset_index=False keeps the input row labels on the sorted frame.
     try:
-        print("Loading Excel file...")
-        df = pd.read_excel(input_file)
+        if df is None:
+            print("Loading Excel file...")
+            df = load_products(input_file)
+        df = df.copy()
         
         df['name'] = df['name'].fillna('').astype(str)
         
         print("Creating sort keys...")
-        df['temp_norm_name'] = df['name'].str.lower().str.replace(r'\s+', '', regex=True)
+        df['temp_norm_name'] = normalize_names(df['name'])
         df['product_type'] = pd.to_numeric(df['product_type'], errors='coerce').fillna(999)
         
         print("Sorting...")
         df.sort_values(by=['temp_norm_name', 'product_type'], ascending=[True, True], inplace=True)
         
         df.drop(columns=['temp_norm_name'], inplace=True)
+        if reset_index:
+            df.reset_index(drop=True, inplace=True)
         
-        print("Saving sorted file...")
-        df.to_excel(output_file, index=False)
-        print(f"Done! Saved {len(df)} items to {output_file}")
+        if output_file:
+            print("Saving sorted file...")
+            save_products(df, output_file)
+            print(f"Done! Saved {len(df)} items to {output_file}")
+        else:
+            print(f"Done! Sorted {len(df)} items")
         
-        return True
+        return df
         
     except Exception as e:
         print(f"An error occurred: {e}")
-        return False
+        return None
+
+
+def normalize_names(names):
+    # Sort/grouping key: lowercased with all whitespace removed, so "Pen  Blue"
+    # and "pen blue" end up in the same group.
+    return names.fillna('').astype(str).str.lower().str.replace(r'\s+', '', regex=True)
+
+
+def normalize_name(name):
+    return re.sub(r'\s+', '', str(name).lower())
+
+
+class GroupIndex:
+    # Normalized name -> base (first Type 1) row and member rows, plus the
+    # uploaded Type 1 id of each group. Lookups are plain dict reads; id
+    # updates from upload threads go through a lock.
+
+    def __init__(self, base_rows=None, members=None):
+        self._base_rows = base_rows or {}
+        self._members = members or {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df):
+        keys = normalize_names(df['name'])
+        types = pd.to_numeric(df['product_type'], errors='coerce')
+        members = {key: list(rows) for key, rows in keys.groupby(keys, sort=False).groups.items()}
+        bases = keys[types == 1]
+        bases = bases[~bases.duplicated()]
+        return cls(dict(zip(bases.values, bases.index)), members)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        return len(self._members)
+
+    def base_row(self, key):
+        return self._base_rows.get(key)
+
+    def members(self, key):
+        return self._members.get(key, [])
+
+    def has_base_row(self, key):
+        return key in self._base_rows
+
+    def base_id(self, key):
+        return self._ids.get(key)
+
+    def set_base_id(self, key, product_id, row=None):
+        # The group's own base row wins; other Type 1 rows of the group only
+        # fill the id in when none is known yet.
+        with self._lock:
+            if key not in self._ids or row is None or row == self._base_rows.get(key):
+                self._ids[key] = product_id
+
+    def seed(self, ids):
+        # Ids from earlier runs or the remote listing, keyed by raw name.
+        added = 0
+        with self._lock:
+            for name, product_id in ids.items():
+                key = normalize_name(name)
+                if key not in self._ids:
+                    self._ids[key] = product_id
+                    added += 1
+        return added
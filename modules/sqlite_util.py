@@ -0,0 +1,14 @@
+class Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so two writers sharing a
+    # database (shard workers, or runs sharing the ID cache) never interleave.
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
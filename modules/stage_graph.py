@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class StageGraph:
+    # Runs pipeline stages as a small dependency graph. A stage starts as soon
+    # as every stage it depends on has finished, so independent stages overlap
+    # and the total time follows the critical path instead of the sum of all
+    # stages. Each stage is called with a dict of the results finished so far.
+    # If a stage raises, the stages that depend on it are skipped.
+
+    def __init__(self):
+        self._stages = {}
+        self._order = []
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self._stages[name] = (func, tuple(deps))
+        self._order.append(name)
+
+    def run(self, workers=None):
+        results = {}
+        failed = set()
+        lock = threading.Lock()
+        pending = list(self._order)
+        running = {}
+        workers = max(1, workers or len(self._order))
+
+        def call(name):
+            func, _ = self._stages[name]
+            with lock:
+                inputs = dict(results)
+            return func(inputs)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    if len(running) >= workers:
+                        break
+                    deps = self._stages[name][1]
+                    if any(dep in failed for dep in deps):
+                        print(f" Skipping {name}: a stage it depends on failed")
+                        failed.add(name)
+                        pending.remove(name)
+                    elif all(dep in results for dep in deps):
+                        running[pool.submit(call, name)] = name
+                        pending.remove(name)
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        print(f" Stage {name} failed: {e}")
+                        failed.add(name)
+                        continue
+                    with lock:
+                        results[name] = value
+        return results
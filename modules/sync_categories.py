@@ -1,102 +1,178 @@
-import pandas as pd
-import requests
 import json
-import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+from .api_client import ApiClient
+from .data_loader import load_products
+from .rate_limiter import RateLimiter
 
-def run(input_file, output_mapping, token, api_base, headers):
-   
-    try:
-        df = pd.read_excel(input_file)
-    except Exception as e:
-        print(f"Error loading file: {e}")
-        return False
 
-    if 'category' not in df.columns:
-        print("Error: 'category' column not found")
-        return False
+def run(input_file, output_mapping, token, api_base, headers, client=None, df=None, names=None,
+        prefetch=True, workers=4, id_cache=None, mapping=None):
+    
+    if names is None:
+        if df is None:
+            try:
+                df = load_products(input_file)
+            except Exception as e:
+                print(f"Error loading file: {e}")
+                return False
+
+        if 'category' not in df.columns:
+            print("Error: 'category' column not found")
+            return False
+
+        names = df['category'].dropna().astype(str).unique()
 
-    mapping = {}
-    if os.path.exists(output_mapping):
+    client = client or ApiClient(headers, rate_limiter=RateLimiter(rate=2))
+
+    # With an ID cache the JSON mapping is only written, never trusted:
+    # the cache knows when an ID has gone stale, the file does not.
+    # Callers syncing batch by batch pass their own mapping, which is
+    # updated in place and saved whole each time.
+    if mapping is None:
+        mapping = {}
+    if not mapping and id_cache is None and os.path.exists(output_mapping):
         try:
             with open(output_mapping, 'r', encoding='utf-8') as f:
-                mapping = json.load(f)
+                mapping.update(json.load(f))
             print(f"Loaded existing mapping with {len(mapping)} categories")
         except:
-            mapping = {}
+            pass
 
-    categories = df['category'].dropna().astype(str).unique()
+    categories = names
     print(f"Found {len(categories)} distinct categories in file")
+
+    cached = {}
+    if id_cache is not None:
+        cached = id_cache.get_many('category', [str(name).strip() for name in categories])
+        mapping.update(cached)
+        print(f"ID cache: {len(cached)} of {len(categories)} categories known")
     
     new_count = 0
     skip_count = 0
+    pending = []
     
     for cat_name in categories:
         cat_name = cat_name.strip()
-        if not cat_name:
+        if not cat_name or cat_name in pending:
             continue
         
         if cat_name in mapping:
             print(f"  {cat_name}: Already mapped (ID: {mapping[cat_name]})")
             skip_count += 1
             continue
-            
-        print(f"Processing category: {cat_name}...")
-        
+
+        pending.append(cat_name)
+
+    index = None
+    if prefetch and pending:
         try:
-            search_url = f"{api_base}/all"
-            params = {"page": 1, "limit": 10, "keyword": cat_name}
-            resp = requests.get(search_url, headers=headers, params=params)
-            resp_json = resp.json()
-            
-            found_id = None
-            if resp.status_code == 200 and 'data' in resp_json:
-                results = resp_json['data']
-                if isinstance(results, dict) and 'data' in results:
-                    results = results['data']
-                if isinstance(results, list):
-                    for item in results:
-                        if item.get('name', '').strip() == cat_name:
-                            found_id = item['id']
-                            break
-            
+            index = {}
+            remote_ids = set()
+            for item in client.fetch_all(f"{api_base}/all"):
+                index.setdefault(str(item.get('name', '')).strip(), item['id'])
+                remote_ids.add(item['id'])
+            print(f"Prefetched {len(index)} existing categories")
+        except Exception as e:
+            print(f"Prefetch failed ({e}), falling back to keyword search")
+            index = None
+
+    if index is not None and cached:
+        # The full listing is here anyway, so drop cached IDs that no longer exist.
+        for cat_name, cached_id in cached.items():
+            if cached_id not in remote_ids:
+                print(f"  {cat_name}: Cached ID {cached_id} no longer exists")
+                del mapping[cat_name]
+                pending.append(cat_name)
+                skip_count -= 1
+
+    if index is not None:
+        to_create = []
+        for cat_name in pending:
+            if cat_name in index:
+                print(f"  {cat_name}: Found ID: {index[cat_name]}")
+                mapping[cat_name] = index[cat_name]
+                new_count += 1
+            else:
+                to_create.append(cat_name)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            created = list(pool.map(lambda name: _create(client, api_base, name), to_create))
+        for cat_name, found_id in zip(to_create, created):
             if found_id:
-                print(f"  Found ID: {found_id}")
                 mapping[cat_name] = found_id
                 new_count += 1
+    else:
+        for cat_name in pending:
+            print(f"Processing category: {cat_name}...")
+            found_id = _search(client, api_base, cat_name)
+            if found_id:
+                print(f"  Found ID: {found_id}")
             else:
-                print(f"  Not found. Creating...")
-                create_url = f"{api_base}/create"
-                payload = {
-                    "name": cat_name,
-                    "identification_number": "",
-                    "description": "",
-                    "status": True
-                }
-                
-                create_resp = requests.post(create_url, headers=headers, json=payload)
-                create_json = create_resp.json()
-                
-                if create_resp.status_code == 200 and create_json.get('status') == 1:
-                    new_data = create_json.get('data')
-                    if new_data and 'id' in new_data:
-                        found_id = new_data['id']
-                        print(f"  Created successfully. New ID: {found_id}")
-                        mapping[cat_name] = found_id
-                        new_count += 1
-                    else:
-                        print(f"  Created but ID not found in response: {create_json}")
-                else:
-                    print(f"  Creation failed: {create_json}")
-                    
-        except Exception as e:
-            print(f"  Error processing {cat_name}: {e}")
-            
-        time.sleep(0.5)
+                found_id = _create(client, api_base, cat_name)
+            if found_id:
+                mapping[cat_name] = found_id
+                new_count += 1
+
+    if id_cache is not None:
+        id_cache.put_many('category', {name: value for name, value in mapping.items() if cached.get(name) != value})
+        id_cache.forget('category', [name for name in cached if name not in mapping])
 
     with open(output_mapping, 'w', encoding='utf-8') as f:
         json.dump(mapping, f, ensure_ascii=False, indent=4)
         
     print(f"Mapping saved. New: {new_count}, Skipped: {skip_count}, Total: {len(mapping)}")
     return True
+
+
+def _search(client, api_base, cat_name):
+    try:
+        search_url = f"{api_base}/all"
+        params = {"page": 1, "limit": 10, "keyword": cat_name}
+        resp = client.get(search_url, params=params)
+        resp_json = resp.json()
+        
+        if resp.status_code == 200 and 'data' in resp_json:
+            results = resp_json['data']
+            if isinstance(results, dict) and 'data' in results:
+                results = results['data']
+            if isinstance(results, list):
+                for item in results:
+                    if item.get('name', '').strip() == cat_name:
+                        return item['id']
+    except Exception as e:
+        print(f"  Error searching {cat_name}: {e}")
+    return None
+
+
+def _create(client, api_base, cat_name):
+    print(f"  {cat_name}: Not found. Creating...")
+    try:
+        create_url = f"{api_base}/create"
+        payload = {
+            "name": cat_name,
+            "identification_number": "",
+            "description": "",
+            "status": True
+        }
+        
+        create_resp, existing_id = client.create(
+            create_url, lambda: _search(client, api_base, cat_name), json=payload
+        )
+        if existing_id:
+            print(f"  {cat_name}: Already created by an earlier attempt, ID: {existing_id}")
+            return existing_id
+        create_json = create_resp.json()
+        
+        if create_resp.status_code == 200 and create_json.get('status') == 1:
+            new_data = create_json.get('data')
+            if new_data and 'id' in new_data:
+                print(f"  {cat_name}: Created successfully. New ID: {new_data['id']}")
+                return new_data['id']
+            print(f"  {cat_name}: Created but ID not found in response: {create_json}")
+        else:
+            print(f"  {cat_name}: Creation failed: {create_json}")
+    except Exception as e:
+        print(f"  Error processing {cat_name}: {e}")
+    return None
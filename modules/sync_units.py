@@ -1,105 +1,181 @@
-import pandas as pd
-import requests
 import json
-import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+from .api_client import ApiClient
+from .data_loader import load_products
+from .rate_limiter import RateLimiter
 
-def run(input_file, output_mapping, token, api_base, headers):
+
+def run(input_file, output_mapping, token, api_base, headers, client=None, df=None, names=None,
+        prefetch=True, workers=4, id_cache=None, mapping=None):
     
-    try:
-        df = pd.read_excel(input_file)
-    except Exception as e:
-        print(f"Error loading file: {e}")
-        return False
+    if names is None:
+        if df is None:
+            try:
+                df = load_products(input_file)
+            except Exception as e:
+                print(f"Error loading file: {e}")
+                return False
+
+        if 'unit' not in df.columns:
+            print("Error: 'unit' column not found")
+            return False
+
+        names = df['unit'].dropna().astype(str).unique()
 
-    if 'unit' not in df.columns:
-        print("Error: 'unit' column not found")
-        return False
+    client = client or ApiClient(headers, rate_limiter=RateLimiter(rate=2))
 
-    mapping = {}
-    if os.path.exists(output_mapping):
+    # With an ID cache the JSON mapping is only written, never trusted:
+    # the cache knows when an ID has gone stale, the file does not.
+    # Callers syncing batch by batch pass their own mapping, which is
+    # updated in place and saved whole each time.
+    if mapping is None:
+        mapping = {}
+    if not mapping and id_cache is None and os.path.exists(output_mapping):
         try:
             with open(output_mapping, 'r', encoding='utf-8') as f:
-                mapping = json.load(f)
+                mapping.update(json.load(f))
             print(f"Loaded existing mapping with {len(mapping)} units")
         except:
-            mapping = {}
+            pass
 
-    units = df['unit'].dropna().astype(str).unique()
+    units = names
     print(f"Found {len(units)} distinct units in file")
+
+    cached = {}
+    if id_cache is not None:
+        cached = id_cache.get_many('unit', [str(name).strip() for name in units])
+        mapping.update(cached)
+        print(f"ID cache: {len(cached)} of {len(units)} units known")
     
     new_count = 0
     skip_count = 0
+    pending = []
     
     for unit_name in units:
         unit_name = unit_name.strip()
-        if not unit_name:
+        if not unit_name or unit_name in pending:
             continue
         
         if unit_name in mapping:
             print(f"  {unit_name}: Already mapped (ID: {mapping[unit_name]})")
             skip_count += 1
             continue
-            
-        print(f"Processing unit: {unit_name}...")
-        
+
+        pending.append(unit_name)
+
+    index = None
+    if prefetch and pending:
         try:
-            search_url = f"{api_base}/all"
-            params = {"page": 1, "limit": 10, "keyword": unit_name}
-            resp = requests.get(search_url, headers=headers, params=params)
-            resp_json = resp.json()
-            
-            found_id = None
-            if resp.status_code == 200 and 'data' in resp_json:
-                results = resp_json['data']
-                if isinstance(results, dict) and 'data' in results:
-                    results = results['data']
-                if isinstance(results, list):
-                    for item in results:
-                        if item.get('name', '').strip() == unit_name:
-                            found_id = item['id']
-                            break
-            
+            index = {}
+            remote_ids = set()
+            for item in client.fetch_all(f"{api_base}/all"):
+                index.setdefault(str(item.get('name', '')).strip(), item['id'])
+                remote_ids.add(item['id'])
+            print(f"Prefetched {len(index)} existing units")
+        except Exception as e:
+            print(f"Prefetch failed ({e}), falling back to keyword search")
+            index = None
+
+    if index is not None and cached:
+        # The full listing is here anyway, so drop cached IDs that no longer exist.
+        for unit_name, cached_id in cached.items():
+            if cached_id not in remote_ids:
+                print(f"  {unit_name}: Cached ID {cached_id} no longer exists")
+                del mapping[unit_name]
+                pending.append(unit_name)
+                skip_count -= 1
+
+    if index is not None:
+        to_create = []
+        for unit_name in pending:
+            if unit_name in index:
+                print(f"  {unit_name}: Found ID: {index[unit_name]}")
+                mapping[unit_name] = index[unit_name]
+                new_count += 1
+            else:
+                to_create.append(unit_name)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            created = list(pool.map(lambda name: _create(client, api_base, name), to_create))
+        for unit_name, found_id in zip(to_create, created):
             if found_id:
-                print(f"  Found ID: {found_id}")
                 mapping[unit_name] = found_id
                 new_count += 1
+    else:
+        for unit_name in pending:
+            print(f"Processing unit: {unit_name}...")
+            found_id = _search(client, api_base, unit_name)
+            if found_id:
+                print(f"  Found ID: {found_id}")
             else:
-                print(f"  Not found. Creating...")
-                create_url = f"{api_base}/create"
-                payload = {
-                    "identification_number": "",
-                    "short_code": unit_name[:5],
-                    "name": unit_name,
-                    "change_rate": 0,
-                    "description": "",
-                    "unit_type": "main",
-                    "status": True
-                }
-                
-                create_resp = requests.post(create_url, headers=headers, json=payload)
-                create_json = create_resp.json()
-                
-                if create_resp.status_code == 200 and create_json.get('status') == 1:
-                    new_data = create_json.get('data')
-                    if new_data and 'id' in new_data:
-                        found_id = new_data['id']
-                        print(f"  Created successfully. New ID: {found_id}")
-                        mapping[unit_name] = found_id
-                        new_count += 1
-                    else:
-                        print(f"  Created but ID not found in response: {create_json}")
-                else:
-                    print(f"  Creation failed: {create_json}")
-                    
-        except Exception as e:
-            print(f"  Error processing {unit_name}: {e}")
-            
-        time.sleep(0.5)
+                found_id = _create(client, api_base, unit_name)
+            if found_id:
+                mapping[unit_name] = found_id
+                new_count += 1
+
+    if id_cache is not None:
+        id_cache.put_many('unit', {name: value for name, value in mapping.items() if cached.get(name) != value})
+        id_cache.forget('unit', [name for name in cached if name not in mapping])
 
     with open(output_mapping, 'w', encoding='utf-8') as f:
         json.dump(mapping, f, ensure_ascii=False, indent=4)
         
     print(f"Mapping saved. New: {new_count}, Skipped: {skip_count}, Total: {len(mapping)}")
     return True
+
+
+def _search(client, api_base, unit_name):
+    try:
+        search_url = f"{api_base}/all"
+        params = {"page": 1, "limit": 10, "keyword": unit_name}
+        resp = client.get(search_url, params=params)
+        resp_json = resp.json()
+        
+        if resp.status_code == 200 and 'data' in resp_json:
+            results = resp_json['data']
+            if isinstance(results, dict) and 'data' in results:
+                results = results['data']
+            if isinstance(results, list):
+                for item in results:
+                    if item.get('name', '').strip() == unit_name:
+                        return item['id']
+    except Exception as e:
+        print(f"  Error searching {unit_name}: {e}")
+    return None
+
+
+def _create(client, api_base, unit_name):
+    print(f"  {unit_name}: Not found. Creating...")
+    try:
+        create_url = f"{api_base}/create"
+        payload = {
+            "identification_number": "",
+            "short_code": unit_name[:5],
+            "name": unit_name,
+            "change_rate": 0,
+            "description": "",
+            "unit_type": "main",
+            "status": True
+        }
+        
+        create_resp, existing_id = client.create(
+            create_url, lambda: _search(client, api_base, unit_name), json=payload
+        )
+        if existing_id:
+            print(f"  {unit_name}: Already created by an earlier attempt, ID: {existing_id}")
+            return existing_id
+        create_json = create_resp.json()
+        
+        if create_resp.status_code == 200 and create_json.get('status') == 1:
+            new_data = create_json.get('data')
+            if new_data and 'id' in new_data:
+                print(f"  {unit_name}: Created successfully. New ID: {new_data['id']}")
+                return new_data['id']
+            print(f"  {unit_name}: Created but ID not found in response: {create_json}")
+        else:
+            print(f"  {unit_name}: Creation failed: {create_json}")
+    except Exception as e:
+        print(f"  Error processing {unit_name}: {e}")
+    return None
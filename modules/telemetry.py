@@ -0,0 +1,183 @@
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+
+
+TRACE_ENV = "FATOORAH_TRACE"
+PROFILE_ENV = "FATOORAH_PROFILE"
+
+# Python 3.12+ allows only one active cProfile per process.
+_profiling = threading.Lock()
+
+
+class Tracer:
+    # Records one JSON line per pipeline stage and per HTTP request (wall
+    # time, status, retries, bytes sent/received) and prints a summary at
+    # the end. With profile=True every stage also runs under cProfile and its
+    # stats are dumped next to the trace file.
+
+    def __init__(self, path=None, profile=False):
+        self.path = path
+        self.profile = profile
+        self.stages = []
+        self.requests = []
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Stages that overlap another profiled stage are timed but not
+        # profiled; run_pipeline runs stages one at a time when profiling.
+        profiler = None
+        if self.profile:
+            if _profiling.acquire(blocking=False):
+                profiler = cProfile.Profile()
+            else:
+                print(f" Not profiling {name}: another stage is being profiled")
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                _profiling.release()
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.stages.append((name, seconds))
+            self._write({"event": "stage", "name": name, "seconds": round(seconds, 6)})
+            if profiler:
+                self._dump_profile(name, profiler)
+
+    def on_request(self, method, url, response, elapsed, attempts):
+        entry = {
+            "event": "http",
+            "method": method,
+            "url": url,
+            "status": response.status_code if response is not None else None,
+            "seconds": round(elapsed, 6),
+            "server_seconds": round(response.elapsed.total_seconds(), 6) if response is not None else None,
+            "retries": attempts - 1,
+            "bytes_sent": _body_size(response.request.body) if response is not None else 0,
+            "bytes_received": len(response.content) if response is not None else 0,
+        }
+        with self._lock:
+            self.requests.append(entry)
+        self._write(entry)
+
+    def summary(self):
+        total = time.perf_counter() - self._started
+        print(f"\n{'=' * 60}")
+        print(f" Timing summary ({total:.2f}s)")
+        print(f"{'-' * 60}")
+        for name, seconds in self.stages:
+            print(f"  {name:<28}{seconds:>10.2f}s")
+
+        if self.requests:
+            latencies = sorted(r["seconds"] for r in self.requests)
+            failed = sum(1 for r in self.requests if r["status"] != 200)
+            retries = sum(r["retries"] for r in self.requests)
+            sent = sum(r["bytes_sent"] for r in self.requests)
+            received = sum(r["bytes_received"] for r in self.requests)
+            print(f"{'-' * 60}")
+            print(f"  Requests: {len(latencies)} ({len(latencies) / total:.1f}/s), non-200: {failed}, retries: {retries}")
+            # "total" includes rate limiter waits and retries, "server" is the
+            # time until the last response's headers arrived.
+            server = sorted(r["server_seconds"] for r in self.requests if r["server_seconds"] is not None)
+            print(f"  Latency p50/p90/p99 total:  {_pcts(latencies)}")
+            print(f"  Latency p50/p90/p99 server: {_pcts(server)}")
+            print(f"  Bytes sent/received: {sent} / {received}")
+        if self.path:
+            print(f"  Trace written to: {self.path}")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry):
+        if not self._file:
+            return
+        entry["ts"] = round(time.time(), 6)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file:
+                self._file.write(line)
+                self._file.flush()
+
+    def _dump_profile(self, name, profiler):
+        base = self.path or "pipeline_trace"
+        out = f"{os.path.splitext(base)[0]}.{name}.prof"
+        profiler.dump_stats(out)
+        print(f"\n  Profile for {name} saved to {out}; top functions:")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(8)
+
+
+class Progress:
+    # Prints done/total, throughput and an ETA at most every `interval`
+    # seconds. The total may grow while rows are still being streamed in.
+
+    def __init__(self, label, total=0, interval=5.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self._started = time.perf_counter()
+        self._last_print = self._started
+        self._lock = threading.Lock()
+
+    def add(self, count=1):
+        with self._lock:
+            self.total += count
+
+    def update(self, count=1):
+        with self._lock:
+            self.done += count
+            now = time.perf_counter()
+            if now - self._last_print < self.interval:
+                return
+            self._last_print = now
+            elapsed = now - self._started
+            rate = self.done / elapsed if elapsed else 0.0
+            remaining = max(self.total - self.done, 0)
+            eta = f"{remaining / rate:.0f}s" if rate else "?"
+        print(f"  [progress] {self.label}: {self.done}/{self.total} ({rate:.1f}/s, ETA {eta})")
+
+
+def from_config(config):
+    # Tracing and profiling can be switched on through config keys or, without
+    # touching code, through the FATOORAH_TRACE / FATOORAH_PROFILE variables.
+    path = config.get('trace_file') or os.environ.get(TRACE_ENV)
+    profile = bool(config.get('profile')) or os.environ.get(PROFILE_ENV, '') not in ('', '0')
+    if path in ('1', 'true', 'yes'):
+        path = os.path.join(str(config.get('base_path', '.')), 'pipeline_trace.jsonl')
+    if not path and not profile:
+        return None
+    return Tracer(path=path, profile=profile)
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def _pcts(ordered):
+    return " / ".join(f"{_pct(ordered, p) * 1000:.0f}" for p in (50, 90, 99)) + " ms"
+
+
+def _pct(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * pct / 100)))]
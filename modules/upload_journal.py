@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+
+
+class UploadJournal:
+    # Append-only JSON Lines checkpoint for send_products. Every success is one
+    # small fsync'd line; the journal is periodically compacted into a single
+    # snapshot line that has the same shape as the old upload_cache.json, so
+    # existing checkpoints are replayed as-is. Entries carry the product key
+    # and payload fingerprint from build_payloads; row indices are only kept
+    # for entries written before keys existed. Before a product is posted an
+    # "inflight" entry is written for its key and the success entry (or a
+    # "settled" entry after a final failure) clears it, so keys still in
+    # flight after a crash may already exist remotely. Row indices are
+    # positions in the order their run used; index_path reads them from an
+    # older file instead (streaming mode used to keep its own checkpoint) and
+    # merges that file's keys into this one.
+
+    def __init__(self, path, compact_every=1000, index_path=None):
+        self.path = path
+        # Where retries of this run's failures must be recorded.
+        self.checkpoint = {'kind': 'journal', 'path': os.path.abspath(path)}
+        self.compact_every = compact_every
+        self.type1_ids = {}
+        self.processed_indices = set()
+        self.synced = {}
+        self.inflight = {}
+        self._lock = threading.Lock()
+        self._appended = 0
+
+        needs_compaction = self._replay(self.path)
+        self._own_indices = self.processed_indices
+        if index_path is not None:
+            self.processed_indices = set()
+            if index_path != path:
+                needs_compaction = self._replay(index_path) or needs_compaction
+        if needs_compaction:
+            self._write_snapshot()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __len__(self):
+        return len(self.processed_indices) + len(self.synced)
+
+    def record(self, index, name=None, new_id=None, key=None, fingerprint=None):
+        entry = {"index": index}
+        if key is not None:
+            entry["key"] = key
+            entry["hash"] = fingerprint
+        if name is not None:
+            entry["name"] = name
+            entry["id"] = new_id
+        self._append(entry)
+
+    def mark_inflight(self, key, index):
+        self._append({"inflight": key, "index": index})
+
+    def clear_inflight(self, key):
+        # The create failed for good and was not found remotely.
+        self._append({"settled": key})
+
+    def merge(self, synced, type1_ids):
+        # Results recorded elsewhere (the distributed shard store), written
+        # as one snapshot.
+        with self._lock:
+            self.synced.update(synced)
+            self.type1_ids.update(type1_ids)
+            for key in synced:
+                self.inflight.pop(key, None)
+            self._compact()
+
+    def _append(self, entry):
+        with self._lock:
+            self._apply(entry)
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._appended += 1
+            if self._appended >= self.compact_every:
+                self._compact()
+
+    def close(self):
+        with self._lock:
+            if self._appended:
+                self._compact()
+            self._file.close()
+
+    def _apply(self, entry):
+        if "type1_ids" in entry or "processed_indices" in entry:
+            self.type1_ids.update(entry.get("type1_ids", {}))
+            self.processed_indices.update(entry.get("processed_indices", []))
+            self.synced.update(entry.get("synced", {}))
+            self.inflight.update(entry.get("inflight", {}))
+            return
+        if "inflight" in entry:
+            self.inflight[entry["inflight"]] = entry["index"]
+            return
+        if "settled" in entry:
+            self.inflight.pop(entry["settled"], None)
+            return
+        if "name" in entry:
+            self.type1_ids[entry["name"]] = entry["id"]
+        if "key" in entry:
+            self.synced[entry["key"]] = entry["hash"]
+            self.inflight.pop(entry["key"], None)
+        else:
+            self.processed_indices.add(entry["index"])
+
+    def _replay(self, path):
+        if not path or not os.path.exists(path):
+            return False
+
+        damaged = False
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                damaged = True
+
+        if damaged:
+            print("Warning: ignored a damaged checkpoint entry (interrupted write)")
+        return damaged or (content and not content.endswith("\n"))
+
+    def _write_snapshot(self):
+        snapshot = {
+            "type1_ids": self.type1_ids,
+            "processed_indices": sorted(self._own_indices),
+            "synced": self.synced,
+            "inflight": self.inflight,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _compact(self):
+        self._file.close()
+        self._write_snapshot()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._appended = 0
@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class UploadScheduler:
+    # Runs uploads on a bounded thread pool while keeping Type 5 rows behind
+    # the Type 1 base of their own group. Base rows and unrelated groups run
+    # in parallel; a dependent row is parked only while its base is in flight
+    # (or not yet seen) and is released as soon as that base finishes.
+
+    def __init__(self, send, group_of, is_base, is_ready, workers=4, max_pending=None):
+        self.send = send
+        self.group_of = group_of
+        self.is_base = is_base
+        self.is_ready = is_ready
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._outstanding = 0
+        self._bases_in_flight = {}
+        self._waiting = {}
+
+    def submit(self, item):
+        group = self.group_of(item)
+        with self._lock:
+            if self.is_base(item):
+                self._bases_in_flight[group] = self._bases_in_flight.get(group, 0) + 1
+            elif group in self._bases_in_flight or not self.is_ready(item):
+                self._waiting.setdefault(group, []).append(item)
+                return
+            self._outstanding += 1
+        self._slots.acquire()
+        self._pool.submit(self._run, item, group, True)
+
+    def join(self):
+        self._wait_idle()
+        # Dependents whose base never showed up are sent anyway so they are
+        # reported as failures the same way the sequential loop did.
+        with self._lock:
+            leftovers = [item for items in self._waiting.values() for item in items]
+            self._waiting.clear()
+            self._outstanding += len(leftovers)
+        for item in leftovers:
+            self._pool.submit(self._run, item, self.group_of(item), False)
+        self._wait_idle()
+        self._pool.shutdown(wait=True)
+
+    def _wait_idle(self):
+        with self._idle:
+            while self._outstanding:
+                self._idle.wait()
+
+    def _run(self, item, group, holds_slot):
+        try:
+            self.send(item)
+        except Exception as e:
+            print(f"  -> Unexpected upload error: {e}")
+        finally:
+            if holds_slot:
+                self._slots.release()
+            released = []
+            with self._lock:
+                if self.is_base(item) and group in self._bases_in_flight:
+                    self._bases_in_flight[group] -= 1
+                    if not self._bases_in_flight[group]:
+                        del self._bases_in_flight[group]
+                        released = self._waiting.pop(group, [])
+                self._outstanding += len(released) - 1
+                if not self._outstanding:
+                    self._idle.notify_all()
+            for dependent in released:
+                self._pool.submit(self._run, dependent, group, False)
@@ -0,0 +1,143 @@
+import json
+
+import pandas as pd
+
+from .build_payloads import DEFAULT_CATEGORY_ID, DEFAULT_UNIT_ID, normalize_barcodes
+from .data_loader import load_products
+from .sort_products import normalize_names
+
+
+SUPPORTED_TYPES = {1, 5}
+REPORT_COLUMNS = ['row', 'name', 'bar_code', 'column', 'value', 'severity', 'error']
+
+
+def run(input_file, output_report, units_mapping, categories_mapping, df=None):
+    # Checks every row once, column by column, before any product is sent.
+    # Rows with errors are written to the report and dropped; warnings (such
+    # as a blank unit falling back to the default) are reported but kept.
+    # Returns the clean rows.
+    try:
+        if df is None:
+            print("Loading Excel file...")
+            df = load_products(input_file)
+        units_map, cats_map = _load_mapping(units_mapping), _load_mapping(categories_mapping)
+    except Exception as e:
+        print(f"Error loading files: {e}")
+        return None
+
+    clean, report = validate(df, units_map, cats_map)
+    _print_summary(len(df), len(clean), report)
+    if not report.empty:
+        report.to_excel(output_report, index=False)
+        print(f"\n Report saved to: {output_report}")
+    return clean
+
+
+def validate(df, units_map, cats_map, check_groups=True):
+    # Returns (clean rows, report). Report rows point at the file: "row" is
+    # the spreadsheet row number (header on row 1). check_groups needs the
+    # whole file, so streaming batches skip it.
+    issues = []
+
+    def check(mask, column, values, message, severity='error'):
+        if mask.any():
+            issues.append(pd.DataFrame({
+                'index': df.index[mask],
+                'column': column,
+                'value': values[mask].astype(str).values,
+                'severity': severity,
+                'error': message[mask].values if isinstance(message, pd.Series) else message,
+            }))
+
+    names = _column(df, 'name').fillna('').astype(str).str.strip()
+    check(names == '', 'name', names, "name is empty")
+
+    raw_types = _column(df, 'product_type')
+    types = pd.to_numeric(raw_types, errors='coerce')
+    check(types.isna(), 'product_type', raw_types, "product_type is missing or not a number")
+    unsupported = types.notna() & ~types.isin(SUPPORTED_TYPES)
+    check(unsupported, 'product_type', raw_types,
+          pd.Series("product_type ", index=df.index) + types.map(lambda v: f"{v:g}")
+          + pd.Series(" is not supported (expected 1 or 5)", index=df.index)
+          .where(types != 2, " (service) is not supported"))
+
+    for column, required in (('sale_price', True), ('buy_price', False)):
+        raw = _column(df, column)
+        numbers = pd.to_numeric(raw, errors='coerce')
+        if required:
+            check(raw.isna(), column, raw, f"{column} is missing")
+        check(raw.notna() & numbers.isna(), column, raw, f"{column} is not a number")
+        check(numbers < 0, column, raw, f"{column} is negative")
+
+    raw_rate = _column(df, 'Conversion_rate')
+    rates = pd.to_numeric(raw_rate, errors='coerce')
+    check((types == 5) & raw_rate.notna() & ~(rates > 0), 'Conversion_rate', raw_rate,
+          "Conversion_rate must be a positive number for Type 5 products")
+
+    for column, mapping, default in (('unit', units_map, DEFAULT_UNIT_ID),
+                                     ('category', cats_map, DEFAULT_CATEGORY_ID)):
+        raw = _column(df, column)
+        values = raw.astype(str).str.strip()
+        blank = raw.isna() | (values == '')
+        known = {str(k).strip() for k in mapping}
+        check(~blank & ~values.isin(known), column, values,
+              f"{column} has no id in the {column} mapping")
+        check(blank, column, values, f"{column} is empty; default id {default} will be used", 'warning')
+
+    if check_groups:
+        # The base may still exist from an earlier run, so this only warns.
+        groups = normalize_names(names)
+        has_base = groups.isin(set(groups[types == 1]))
+        check((types == 5) & ~has_base, 'name', names,
+              "no Type 1 row with this name in the file; its base must already be uploaded", 'warning')
+
+    if not issues:
+        return df, pd.DataFrame(columns=REPORT_COLUMNS)
+
+    report = pd.concat(issues, ignore_index=True)
+    report = report.sort_values('index', kind='stable')
+    errors = report.loc[report['severity'] == 'error', 'index'].unique()
+    report.insert(0, 'row', report['index'] + 2 if pd.api.types.is_integer_dtype(report['index']) else report['index'])
+    report.insert(1, 'name', names.loc[report['index']].values)
+    report.insert(2, 'bar_code', normalize_barcodes(_column(df, 'bar_code')).loc[report['index']].values)
+    report = report.drop(columns='index')[REPORT_COLUMNS].reset_index(drop=True)
+    return df.drop(index=errors), report
+
+
+def filter_batches(batches, units_map, cats_map, output_report):
+    # Streaming variant: validates each batch as it is read and writes one
+    # report for the whole file once the batches are exhausted. The maps are
+    # read at every batch, so a caller can keep filling them in as it goes.
+    total, kept, reports = 0, 0, []
+    for batch in batches:
+        clean, report = validate(batch, units_map, cats_map, check_groups=False)
+        total += len(batch)
+        kept += len(clean)
+        if not report.empty:
+            reports.append(report)
+        yield clean
+
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=REPORT_COLUMNS)
+    _print_summary(total, kept, report)
+    if not report.empty:
+        report.to_excel(output_report, index=False)
+        print(f" Validation report saved to: {output_report}")
+
+
+def _print_summary(total, kept, report):
+    warnings = int((report['severity'] == 'warning').sum())
+    print(f"Validated {total} rows: {kept} clean, {total - kept} rejected, {warnings} warning(s)")
+    errors = report[report['severity'] == 'error']
+    for message, count in errors['error'].value_counts().head(10).items():
+        print(f"  {count} x {message}")
+
+
+def _load_mapping(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _column(df, name):
+    if name in df.columns:
+        return df[name]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)